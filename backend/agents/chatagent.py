@@ -1,26 +1,45 @@
-from typing import Dict, List, Optional
-from fastapi import APIRouter, Request
-from bson import ObjectId
-from pymongo import MongoClient
-from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.vectorstores import Chroma
-from langchain.prompts import PromptTemplate
-from langchain.chains import ConversationChain
-from langchain.document_loaders import DirectoryLoader
-from langchain.indexes import VectorstoreIndexCreator
-from langchain.chat_models import ChatVertexAI
-from langchain.memory import VectorStoreRetrieverMemory
-from elevenlabs import generate, set_api_key
+import asyncio
+import json
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Tuple
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
-import os
+from bson import ObjectId
+from pydantic import BaseModel
+from chat_sessions import ChatSession, chat_sessions
+from agents.codeagent import settings as code_agent_settings
+from db import find_project, get_db, get_hackathon
+from metrics import span
+from rate_limit import credit_ledger
+from tts_cache import audio_cache, audio_key
+
+# langchain, chromadb and GitPython are imported on first use, not at server start
+if TYPE_CHECKING:
+    from langchain.chains import LLMChain
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Constants
-MONGODB_URL = "mongodb://localhost:27017/"
-DATABASE_NAME = "JuryNova"
-# ...existing code...
+VOICE = "Rachel"  # You can change this to any available voice
+TTS_MODEL = "eleven_monolingual_v1"
+NO_CODE_CONTEXT = "No code context: the project's repository has not been fetched yet."
+
+router = APIRouter()
+
+# Pydantic models for request validation
+class SessionCreate(BaseModel):
+    project_id: str
+
+class ChatTurn(BaseModel):
+    session_id: str
+    question: str
 
 DEFAULT_TEMPLATE = """You are an expert hackathon judge and technical analyst with deep experience in market research and code review.
 
@@ -29,7 +48,10 @@ Context for evaluation:
 - Hackathon Theme: {theme}
 - Required Technologies: {technologies}
 
-Previous conversation context:
+Relevant project code:
+{context}
+
+Previous conversation:
 {history}
 
 Guidelines for your response:
@@ -45,93 +67,297 @@ Human: {input}
 AI: """
 
 
+def sse(event: str, data: Dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 
 class ChatAgent:
     def __init__(self):
-        self.client = MongoClient(MONGODB_URL)
-        self.db = self.client[DATABASE_NAME]
-        self.llm = ChatVertexAI()
-        # Initialize ElevenLabs
-        set_api_key(os.getenv("ELEVENLABS_API_KEY"))
+        from llm_gateway import gateway
+        from vector_store import RetrieverCache, close_vectorstore
+        # Streaming, so /chat-agent/stream can pass tokens on as they are generated
+        self.llm = gateway.chat_llm(streaming=True)
+        self.retrievers = RetrieverCache(on_evict=lambda entry: close_vectorstore(entry[0].vectorstore))
         
-    def get_hackathon_info(self) -> tuple[str, str, bool]:
-        hackathon = next(self.db.hackathons.find(), {})
+    async def get_hackathon_info(self) -> tuple[str, str]:
+        hackathon = await get_hackathon()
         return (
             hackathon.get("technologies", ""),
-            hackathon.get("theme", ""),
-            hackathon.get("isAllowed", False)
+            hackathon.get("theme", "")
         )
     
-    def get_project_info(self, project_id: str) -> Optional[Dict]:
-        return self.db.projects.find_one({"_id": ObjectId(project_id)})
-    
-    def setup_memory(self, project_id: str, project_desc: str, theme: str, technologies: str):
-        directory = f"projects_source_code/{project_id}"
-        loader = DirectoryLoader(directory, silent_errors=True)
-        index = VectorstoreIndexCreator().from_loaders([loader])
-        retriever = index.vectorstore.as_retriever()
-        memory = VectorStoreRetrieverMemory(retriever=retriever)
-        
-        # Save context
-        memory.save_context({"input": f"Idea : {project_desc}"}, {"output": "..."})
-        memory.save_context({"input": f"Theme for the Hackathon : {theme}"}, {"output": "..."})
-        memory.save_context(
-            {"input": f"Technologies that must be used for the hackathon project : {technologies}"}, 
-            {"output": "..."}
+    async def get_project_info(self, project_id: str) -> Optional[Dict]:
+        return await find_project(project_id, {"shortDescription": 1, "codeAgentCommit": 1})
+
+    def open_mirror(self, project_id: str):
+        """The code agent's bare mirror of the project, or None before its first clone."""
+        from git import InvalidGitRepositoryError, NoSuchPathError, Repo
+        try:
+            return Repo(Path(code_agent_settings.PROJECT_DIR) / f"{project_id}.git")
+        except (InvalidGitRepositoryError, NoSuchPathError):
+            return None
+
+    def get_commit(self, project: Dict) -> Optional[str]:
+        """Commit the project's vector store is keyed by, or None if the repository is not mirrored yet."""
+        if project.get("codeAgentCommit"):
+            return project["codeAgentCommit"]
+        from git import BadName
+        from repo_mirror import HEAD_REF
+        mirror = self.open_mirror(str(project["_id"]))
+        if mirror is None:
+            return None
+        try:
+            return mirror.commit(HEAD_REF).hexsha
+        except (BadName, ValueError):
+            return None
+
+    def load_retriever(self, project_id: str, commit: str) -> Tuple[Any, threading.Lock]:
+        """Open the persisted store for this commit, indexing the mirrored source only once.
+
+        Returns:
+            Tuple - the store's retriever and the lock to hold while querying it
+
+        Raises:
+            LookupError: the commit is not in the mirror, so there is nothing to index
+        """
+        from git import BadName
+        from repo_mirror import MirrorLoader
+        from vector_store import build_vectorstore, open_vectorstore, store_lock
+        vectorstore = open_vectorstore(project_id, commit)
+        if vectorstore is None:
+            mirror = self.open_mirror(project_id)
+            if mirror is None:
+                raise LookupError(f"Project {project_id} is not mirrored")
+            try:
+                mirror.commit(commit)
+            except (BadName, ValueError):
+                raise LookupError(f"Commit {commit} of project {project_id} is not mirrored")
+            vectorstore = build_vectorstore(MirrorLoader(mirror, commit).lazy_load(), project_id, commit)
+        return vectorstore.as_retriever(), store_lock(project_id, commit)
+
+    def get_retriever(self, project: Dict) -> Optional[Tuple[Any, threading.Lock]]:
+        """The project's code retriever and its lock, or None while there is no code to search."""
+        project_id = str(project["_id"])
+        commit = self.get_commit(project)
+        if commit is None:
+            return None
+        try:
+            # Failed loads are not cached, so the next turn tries again
+            return self.retrievers.get(
+                (project_id, commit),
+                lambda: self.load_retriever(project_id, commit)
+            )
+        except LookupError:
+            return None
+
+    def build_conversation(self, project: Dict, theme: str, technologies: str) -> "LLMChain":
+        from langchain.chains import LLMChain
+        from langchain.prompts import PromptTemplate
+        # Project context goes straight into the prompt instead of being
+        # re-written into the project's vector store on every turn
+        prompt = PromptTemplate(
+            input_variables=["context", "history", "input"],
+            template=DEFAULT_TEMPLATE,
+            partial_variables={
+                "project_desc": project["shortDescription"],
+                "theme": theme,
+                "technologies": technologies
+            }
         )
-        
-        return memory
-    
-    # ...existing code...
+        return LLMChain(llm=self.llm, prompt=prompt, verbose=True)
 
-async def process_chat(self, request_data: Dict) -> Dict:
-    technologies, theme, is_allowed = self.get_hackathon_info()
-        
-    if not is_allowed:
-        return {"answer": "Sorry, We have reached our credit limit.", "chathistory": [], "audio": None}
-        
-    project = self.get_project_info(request_data["project_id"])
+    def answer(self, session: ChatSession, question: str, theme: str, technologies: str,
+               callbacks: Optional[List[Any]] = None) -> str:
+        """Run one turn of the session's conversation; blocking, so called in a worker thread."""
+        project_id = str(session.project["_id"])
+        # The chain is built once per session and rebuilt only if the hackathon changes
+        if session.conversation is None or session.conversation_key != (theme, technologies):
+            session.conversation = self.build_conversation(session.project, theme, technologies)
+            session.conversation_key = (theme, technologies)
+
+        with span("chat", "memory", project_id=project_id):
+            docs = []
+            entry = self.get_retriever(session.project)
+            if entry is not None:
+                retriever, lock = entry
+                with lock:
+                    docs = retriever.get_relevant_documents(question)
+        context = "\n".join(doc.page_content for doc in docs) if docs else NO_CODE_CONTEXT
+        with span("chat", "llm", project_id=project_id):
+            return session.conversation.predict(
+                context=context,
+                history=session.history(),
+                input=question,
+                callbacks=callbacks
+            )
+
+    def summarize(self, summary: str, new_lines: str) -> str:
+        """Extend a session's running summary with older turns; blocking."""
+        from langchain.chains import LLMChain
+        from langchain.memory.prompt import SUMMARY_PROMPT
+        with span("chat", "summarize"):
+            return LLMChain(llm=self.llm, prompt=SUMMARY_PROMPT).predict(summary=summary, new_lines=new_lines)
+
+    def synthesize(self, text: str):
+        """Stream speech for text, from the audio cache when it was spoken before."""
+        try:
+            yield from audio_cache.stream(text, VOICE, TTS_MODEL)
+        except Exception as e:
+            logger.exception(f"Error generating audio: {e}")
+
+    async def save_audio_text(self, text: str) -> Optional[str]:
+        """Register an answer for speech synthesis and return its audio URL.
+
+        The URL is the content address of the speech, so repeated answers
+        share one URL and one cached clip. Once the TTS budget is spent only
+        answers that are already cached get audio.
+        """
+        if credit_ledger.exhausted("elevenlabs") and not audio_cache.contains(text, VOICE, TTS_MODEL):
+            return None
+        key = audio_key(text, VOICE, TTS_MODEL)
+        await get_db().chat_audio.update_one(
+            {"_id": key},
+            {"$set": {"text": text, "createdAt": datetime.utcnow()}},
+            upsert=True
+        )
+        return f"/api/chat-agent/audio/{key}"
+
+    async def open_session(self, session_id: str) -> ChatSession:
+        session = await chat_sessions.get(session_id, self.get_project_info)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Chat session not found")
+        return session
+
+    async def check_request(self, session: ChatSession) -> tuple[Optional[Dict], str, str]:
+        """Load the context of a chat turn.
+
+        Returns:
+            tuple - a canned reply (None if the turn can proceed), the
+            hackathon theme and technologies
+        """
+        with span("chat", "context", project_id=str(session.project["_id"])):
+            from llm_gateway import gateway
+            # A re-analysis moves the project to a new code store during the session
+            fresh = await find_project(str(session.project["_id"]), {"codeAgentCommit": 1})
+            if fresh is not None:
+                session.project["codeAgentCommit"] = fresh.get("codeAgentCommit")
+            technologies, theme = await self.get_hackathon_info()
+            if credit_ledger.exhausted(gateway.provider.name):
+                return await self.canned_reply("Sorry, We have reached our credit limit."), theme, technologies
+            return None, theme, technologies
+
+    async def canned_reply(self, answer: str) -> Dict:
+        return {"answer": answer, "audio_url": await self.save_audio_text(answer)}
+
+    async def finish_turn(self, session: ChatSession, question: str, ai_response: str) -> Dict:
+        with span("chat", "save"):
+            await chat_sessions.append(session, question, ai_response)
+            audio_url = await self.save_audio_text(ai_response)
+        # Summarizing older turns must not delay this answer
+        asyncio.create_task(chat_sessions.compact(session, self.summarize))
+        return {
+            "answer": ai_response,
+            # Audio is fetched (and streamed) separately instead of riding in this payload
+            "audio_url": audio_url
+        }
+
+    async def process_chat(self, session: ChatSession, question: str) -> Dict:
+        async with session.lock:
+            reply, theme, technologies = await self.check_request(session)
+            if reply is not None:
+                return reply
+
+            loop = asyncio.get_running_loop()
+            ai_response = await loop.run_in_executor(
+                None, self.answer, session, question, theme, technologies
+            )
+            return await self.finish_turn(session, question, ai_response)
+
+    async def stream_chat(self, session: ChatSession, question: str) -> AsyncIterator[str]:
+        """Server-sent events: a "token" event per generated token, then "done" with the full turn."""
+        async with session.lock:
+            reply, theme, technologies = await self.check_request(session)
+            if reply is not None:
+                yield sse("done", reply)
+                return
+
+            from llm_gateway import TokenQueueHandler
+            loop = asyncio.get_running_loop()
+            queue: asyncio.Queue = asyncio.Queue()
+            answer = loop.run_in_executor(
+                None, self.answer, session, question, theme, technologies,
+                [TokenQueueHandler(loop, queue)]
+            )
+
+            while True:
+                token = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({token, answer}, return_when=asyncio.FIRST_COMPLETED)
+                if token in done:
+                    yield sse("token", {"token": token.result()})
+                    continue
+                token.cancel()
+                break
+            while not queue.empty():
+                yield sse("token", {"token": queue.get_nowait()})
+
+            try:
+                ai_response = await answer
+            except Exception as e:
+                yield sse("error", {"detail": str(e)})
+                return
+            yield sse("done", await self.finish_turn(session, question, ai_response))
+
+
+_chat_agent: Optional[ChatAgent] = None
+
+
+def get_chat_agent() -> ChatAgent:
+    """The shared chat agent, created on first use or by the startup pre-warm."""
+    global _chat_agent
+    if _chat_agent is None:
+        _chat_agent = ChatAgent()
+    return _chat_agent
+
+
+@router.post("/chat-agent/sessions")
+async def create_chat_session(request_data: SessionCreate):
+    """Start a conversation about a project; later turns only send its session_id."""
+    if not ObjectId.is_valid(request_data.project_id):
+        raise HTTPException(status_code=400, detail="Invalid project ID format")
+    project = await get_chat_agent().get_project_info(request_data.project_id)
     if not project:
-        return {"answer": "Project not found.", "chathistory": [], "audio": None}
-        
-        
-    memory = self.setup_memory(
-        request_data["project_id"],
-        project["shortDescription"],
-        theme,
-        technologies
-    )
-    
-    prompt = PromptTemplate(
-        input_variables=["history", "input", "project_desc", "theme", "technologies"], 
-        template=DEFAULT_TEMPLATE
-    )
-    
-    conversation = ConversationChain(
-        llm=self.llm,
-        prompt=prompt,
-        memory=memory,
-        verbose=True
+        raise HTTPException(status_code=404, detail="Project not found")
+    session = await chat_sessions.create(project)
+    return {"message": "Session created", "session_id": session.id}
+
+
+@router.post("/chat-agent")
+async def chat_agent_endpoint(request_data: ChatTurn):
+    """Answer a judge's question about a project."""
+    agent = get_chat_agent()
+    session = await agent.open_session(request_data.session_id)
+    return await agent.process_chat(session, request_data.question)
+
+
+@router.post("/chat-agent/stream")
+async def chat_agent_stream_endpoint(request_data: ChatTurn):
+    """Answer a judge's question as a server-sent event stream of tokens."""
+    agent = get_chat_agent()
+    # Resolved before streaming starts, so an expired session is a plain 404
+    session = await agent.open_session(request_data.session_id)
+    return StreamingResponse(agent.stream_chat(session, request_data.question), media_type="text/event-stream")
+
+
+@router.get("/chat-agent/audio/{audio_id}")
+async def chat_agent_audio_endpoint(audio_id: str):
+    """Stream the spoken version of a chat answer."""
+    audio = await get_db().chat_audio.find_one({"_id": audio_id})
+    if not audio:
+        raise HTTPException(status_code=404, detail="Audio not found")
+    return StreamingResponse(
+        get_chat_agent().synthesize(audio["text"]),
+        media_type="audio/mpeg",
+        # Content-addressed, so the bytes behind a URL never change
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
     )
-    
-    try:
-        audio = generate(
-            text=ai_response,
-            voice="Rachel",  # You can change this to any available voice
-            model="eleven_monolingual_v1"
-        )
-    except Exception as e:
-        print(f"Error generating audio: {e}")
-        audio = None
-    
-    chat_history = request_data["chathistory"]
-    chat_history.append({
-        "input": request_data["question"], 
-        "output": ai_response
-    })
-    
-    return {
-        "answer": ai_response,
-        "chathistory": chat_history,
-        "audio": audio  # This will be binary audio data
-    }
\ No newline at end of file
@@ -1,20 +1,25 @@
 import logging
-from typing import List, Dict, Any
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 from pathlib import Path
 from fastapi import APIRouter, HTTPException
-from langchain.chat_models import ChatVertexAI
-from langchain.indexes import VectorstoreIndexCreator
-from langchain.document_loaders import GitLoader
-from git import Repo
-from motor.motor_asyncio import AsyncIOMotorClient
 from bson.objectid import ObjectId
 from pydantic import BaseSettings
+from db import find_project, get_db, get_hackathon, update_project
+from jobs import job_queue
+from metrics import span
+
+# langchain, chromadb and GitPython are imported on first use, not at server start
+if TYPE_CHECKING:
+    from langchain.indexes.vectorstore import VectorStoreIndexWrapper
 
 # Configuration class
 class Settings(BaseSettings):
-    MONGODB_URL: str = "mongodb://localhost:27017"
-    DATABASE_NAME: str = "JuryNova"
     PROJECT_DIR: str = "./projects_source_code"
+    QUESTION_CONCURRENCY: int = 5
+    QUESTION_TIMEOUT: float = 120
 
     class Config:
         env_file = ".env"
@@ -27,33 +32,34 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# MongoDB client
-client = AsyncIOMotorClient(settings.MONGODB_URL)
-db = client[settings.DATABASE_NAME]
+# Shared by all analyses so concurrent jobs cannot multiply the number of LLM calls in flight
+question_executor = ThreadPoolExecutor(max_workers=settings.QUESTION_CONCURRENCY)
 
 class CodeAnalyzer:
     def __init__(self, repo_link: str, project_id: str):
         self.repo_link = repo_link
         self.project_id = project_id
-        self.project_dir = Path(settings.PROJECT_DIR) / project_id
-        self.llm = ChatVertexAI()
+        from llm_gateway import gateway
+        from repo_mirror import RepoMirror
+        self.mirror = RepoMirror(repo_link, Path(settings.PROJECT_DIR) / f"{project_id}.git")
+        self.languages: Dict[str, int] = {}
+        self.llm = gateway.chat_llm()
 
     async def get_technologies(self) -> str:
         """Fetch technologies from hackathon collection."""
         try:
-            hackathon = await db.hackathons.find_one({})
-            return hackathon.get("technologies", "") if hackathon else ""
+            hackathon = await get_hackathon()
+            return hackathon.get("technologies", "")
         except Exception as e:
             logger.error(f"Error fetching technologies: {e}")
             return ""
 
-    def clone_repository(self) -> GitLoader:
-        """Clone repository and return GitLoader instance."""
+    def sync_repository(self) -> str:
+        """Clone or fetch the project's mirror and return the HEAD commit SHA."""
         try:
-            repo = Repo.clone_from(self.repo_link, self.project_dir)
-            return GitLoader(repo_path=str(self.project_dir), branch=repo.head.reference)
+            return self.mirror.sync()
         except Exception as e:
-            logger.error(f"Error cloning repository: {e}")
+            logger.error(f"Error syncing repository: {e}")
             raise HTTPException(status_code=500, detail="Failed to clone repository")
 
     def get_questions(self, technologies: str) -> List[str]:
@@ -94,47 +100,213 @@ class CodeAnalyzer:
                 3. What scalability considerations should be addressed?"""
             ]
 
+    def load_index(self, base_commit: Optional[str]) -> Tuple["VectorStoreIndexWrapper", str, bool]:
+        """Bring the project's index up to the repository HEAD.
+
+        When an earlier analysis exists, only files changed since base_commit
+        are re-chunked and re-embedded.
+
+        Returns:
+            Tuple - the index, the commit it reflects, and whether anything
+            relevant changed since base_commit
+        """
+        from langchain.indexes.vectorstore import VectorStoreIndexWrapper
+        from repo_mirror import MirrorLoader
+        from vector_store import (
+            build_vectorstore, close_vectorstore, derive_vectorstore, open_vectorstore, stored_sources
+        )
+
+        with span("code_agent", "sync", project_id=self.project_id):
+            commit = self.sync_repository()
+        vectorstore = open_vectorstore(self.project_id, commit)
+        if vectorstore is not None:
+            self.mirror.mark_analyzed(commit)
+            return VectorStoreIndexWrapper(vectorstore=vectorstore), commit, commit != base_commit
+
+        base_store = None
+        if base_commit and self.mirror.has_commit(base_commit):
+            base_store = open_vectorstore(self.project_id, base_commit)
+        if base_store is None:
+            loader = MirrorLoader(self.mirror.repo, commit)
+            # Files are read lazily while they are embedded, so this is load and embed together
+            with span("code_agent", "load_embed", project_id=self.project_id, mode="full") as fields:
+                vectorstore = build_vectorstore(loader.lazy_load(), self.project_id, commit)
+                fields["bytes"] = sum(loader.languages.values())
+            self.mirror.mark_analyzed(commit)
+            self.languages = loader.languages
+            return VectorStoreIndexWrapper(vectorstore=vectorstore), commit, True
+
+        with span("code_agent", "load", project_id=self.project_id, mode="incremental") as fields:
+            changed, removed = self.mirror.changed_files(base_commit, commit)
+            documents = MirrorLoader(self.mirror.repo, commit, paths=changed).load()
+            stale = stored_sources(base_store, changed | removed)
+            fields.update(changed=len(changed), removed=len(removed))
+        if not documents and not stale:
+            logger.info(f"No relevant changes for project {self.project_id} since {base_commit}")
+            return VectorStoreIndexWrapper(vectorstore=base_store), base_commit, False
+
+        with span("code_agent", "embed", project_id=self.project_id, mode="incremental", documents=len(documents)):
+            vectorstore = derive_vectorstore(self.project_id, base_commit, commit, documents, stale)
+        close_vectorstore(base_store)
+        self.mirror.mark_analyzed(commit)
+        return VectorStoreIndexWrapper(vectorstore=vectorstore), commit, True
+
+    def answer_question(self, index: "VectorStoreIndexWrapper", question: str, retrieval_lock: threading.Lock,
+                        abandoned: threading.Event) -> str:
+        """Equivalent of index.query that only serializes the vector store lookup.
+
+        Stops before the LLM call once the analysis has given up on the question.
+        """
+        from langchain.chains.question_answering import load_qa_chain
+        # Shared with chat queries of the same store, see vector_store.store_lock
+        with retrieval_lock, span("code_agent", "retrieve", project_id=self.project_id):
+            docs = index.vectorstore.as_retriever().get_relevant_documents(question)
+        if abandoned.is_set():
+            raise TimeoutError("Question abandoned")
+        chain = load_qa_chain(self.llm, chain_type="stuff")
+        with span("code_agent", "llm", project_id=self.project_id):
+            return chain.run(input_documents=docs, question=question)
+
+    async def ask_questions(self, index: "VectorStoreIndexWrapper", commit: str,
+                            questions: List[str]) -> List[Dict[str, str]]:
+        """Ask all questions concurrently, saving each answer as soon as it arrives.
+
+        A question that fails or exceeds QUESTION_TIMEOUT is recorded with an
+        empty answer and an error instead of failing the whole analysis. The
+        timeout counts from when a thread picks the question up, since the
+        pool is shared by concurrent analyses and questions may wait for it.
+        """
+        from vector_store import store_lock
+        loop = asyncio.get_running_loop()
+        retrieval_lock = store_lock(self.project_id, commit)
+        placeholders = [{"question": q, "answer": ""} for q in questions]
+        await get_db().projects.update_one(
+            {"_id": ObjectId(self.project_id), "codeAgentAnalysis": {"$exists": False}},
+            {"$set": {"codeAgentAnalysis": placeholders}}
+        )
+
+        async def ask(i: int, question: str) -> Dict[str, str]:
+            started = loop.create_future()
+            abandoned = threading.Event()
+
+            def run() -> str:
+                # Work given up on while it waited for a thread is skipped
+                if abandoned.is_set():
+                    raise TimeoutError("Question abandoned")
+                loop.call_soon_threadsafe(lambda: started.done() or started.set_result(None))
+                return self.answer_question(index, question, retrieval_lock, abandoned)
+
+            work = loop.run_in_executor(question_executor, run)
+            try:
+                await asyncio.wait({started, work}, return_when=asyncio.FIRST_COMPLETED)
+                # Shielded: a timed-out thread cannot be stopped, only told to skip the LLM call
+                answer = await asyncio.wait_for(asyncio.shield(work), settings.QUESTION_TIMEOUT)
+                result = {"question": question, "answer": answer}
+            except asyncio.TimeoutError:
+                logger.error(f"Question {i} timed out for project {self.project_id}")
+                result = {"question": question, "answer": "", "error": "timed out"}
+            except Exception as e:
+                logger.error(f"Question {i} failed for project {self.project_id}: {e}")
+                result = {"question": question, "answer": "", "error": str(e)}
+            finally:
+                if not work.done():
+                    abandoned.set()
+            await update_project(self.project_id, {f"codeAgentAnalysis.{i}": result})
+            return result
+
+        return list(await asyncio.gather(*(ask(i, q) for i, q in enumerate(questions))))
+
     async def analyze_code(self) -> List[Dict[str, str]]:
-        """Perform code analysis and return results."""
+        """Perform code analysis and return results.
+
+        Re-running it on an analyzed project only re-embeds what changed and
+        skips the LLM questions when no relevant file did.
+        """
         try:
-            loader = self.clone_repository()
-            index = VectorstoreIndexCreator().from_loaders([loader])
-            technologies = await self.get_technologies()
-            questions = self.get_questions(technologies)
-            
-            results = []
-            for question in questions:
-                response = index.query(question, self.llm)
-                results.append({"question": question, "answer": response})
+            project = await find_project(
+                self.project_id, {"codeAgentCommit": 1, "codeAgentAnalysis": 1, "codeSignatureCommit": 1}
+            ) or {}
+            base_commit = project.get("codeAgentCommit")
 
-            await self.save_results(results)
-            return results
+            loop = asyncio.get_running_loop()
+            index, commit, changed = await loop.run_in_executor(None, self.load_index, base_commit)
+            from vector_store import close_vectorstore, prune_stores
+            try:
+                if project.get("codeSignatureCommit") != commit:
+                    await self.save_signature(commit)
+                previous = project.get("codeAgentAnalysis")
+                if not changed and previous and not any(r.get("error") for r in previous):
+                    return previous
+
+                technologies = await self.get_technologies()
+                questions = self.get_questions(technologies)
+                with span("code_agent", "questions", project_id=self.project_id):
+                    results = await self.ask_questions(index, commit, questions)
+                if all(r.get("error") for r in results):
+                    raise RuntimeError("Every analysis question failed")
+
+                with span("code_agent", "save", project_id=self.project_id):
+                    await self.save_results(results, commit)
+                prune_stores(self.project_id)
+                return results
+            finally:
+                close_vectorstore(index.vectorstore)
 
         except Exception as e:
-            logger.error(f"Error in code analysis: {e}")
-            raise HTTPException(status_code=500, detail="Code analysis failed")
-        finally:
-            # Cleanup: Remove cloned repository
-            if self.project_dir.exists():
-                import shutil
-                shutil.rmtree(self.project_dir)
-
-    async def save_results(self, results: List[Dict[str, str]]) -> None:
-        """Save analysis results to database."""
+            logger.error(f"Error in code analysis for project {self.project_id}: {e}")
+            # Re-raised as is so the job records the actual failure
+            raise
+
+    async def save_signature(self, commit: str) -> None:
+        """Store the MinHash signature and LSH bands used by the similar-projects lookup.
+
+        Best effort: a failure is logged and retried on the next analysis,
+        never failing this one.
+        """
+        from similarity import code_signature, signature_fields
+        try:
+            loop = asyncio.get_running_loop()
+            with span("code_agent", "signature", project_id=self.project_id):
+                signature = await loop.run_in_executor(None, code_signature, self.mirror.repo, commit)
+            await update_project(self.project_id, {**signature_fields(signature), "codeSignatureCommit": commit})
+        except Exception as e:
+            logger.error(f"Error computing code signature for project {self.project_id}: {e}")
+
+    async def save_results(self, results: List[Dict[str, str]], commit: str) -> None:
+        """Save analysis results and the analyzed commit to database."""
         try:
-            query = {"_id": ObjectId(self.project_id)}
-            update = {"$set": {"codeAgentAnalysis": results}}
-            await db.projects.update_one(query, update)
+            update = {"codeAgentAnalysis": results, "codeAgentCommit": commit}
+            if self.languages:
+                # Bytes of ingested source per detected language
+                update["codeAgentLanguages"] = self.languages
+            await update_project(self.project_id, update)
             logger.info(f"Analysis results saved for project {self.project_id}")
         except Exception as e:
             logger.error(f"Error saving results: {e}")
-            raise HTTPException(status_code=500, detail="Failed to save analysis results")
+            raise
 
 @router.get("/code-agent")
 async def code_agent_endpoint():
     """Health check endpoint."""
     return {"status": "operational", "service": "Code Agent"}
 
+@router.post("/reanalyze/{project_id}")
+async def reanalyze_project(project_id: str) -> Dict[str, str]:
+    """Queue an incremental re-analysis of a project's repository."""
+    if not ObjectId.is_valid(project_id):
+        raise HTTPException(status_code=400, detail="Invalid project ID format")
+    project = await find_project(project_id, {"githubLink": 1})
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    job_id = await job_queue.enqueue(
+        "code_agent",
+        {"repo_link": project["githubLink"], "project_id": project_id},
+        project_id=project_id,
+        dedupe=True
+    )
+    return {"message": "Re-analysis queued", "job_id": job_id}
+
 async def invoke_code_agent(repo_link: str, project_id: str) -> None:
     """Main function to invoke code analysis."""
     analyzer = CodeAnalyzer(repo_link, project_id)
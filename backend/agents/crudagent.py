@@ -1,21 +1,27 @@
 from bson import ObjectId
-from fastapi import APIRouter, Request, HTTPException
-from pymongo import MongoClient
-from typing import List, Dict, Any
-from pydantic import BaseModel, HttpUrl
-from agents.codeagent import invoke_code_agent
-from agents.marketagent import invoke_market_agent
-from annoy import AnnoyIndex
-import cohere
-import numpy as np
-import pandas as pd
+from fastapi import APIRouter, Request, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
+from pydantic import BaseModel, Field, HttpUrl
+from db import find_project, find_projects, get_db, insert_project, insert_projects, save_hackathon, serialize
+from jobs import job_queue
+from metrics import span
+from search_index import INDEX_FIELDS, embed_texts, search_index
+from similarity import CODE_THRESHOLD, DESCRIPTION_THRESHOLD, description_matrix, similar_code
 import os
 import asyncio
+import csv
+import io
+import json
+import logging
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Pydantic models for request validation
 class ProjectCreate(BaseModel):
     shortDescription: str
@@ -24,10 +30,8 @@ class ProjectCreate(BaseModel):
     theme: str
 
 class HackathonCreate(BaseModel):
-    name: str
-    description: str
-    startDate: str
-    endDate: str
+    theme: str
+    technologies: str
 
 class ReviewUpdate(BaseModel):
     project_id: str
@@ -35,13 +39,31 @@ class ReviewUpdate(BaseModel):
 
 class SearchQuery(BaseModel):
     query: str
+    theme: Optional[str] = None
+    isReviewed: Optional[bool] = None
+    technologies: List[str] = []
+    limit: int = Field(10, ge=1, le=50)
+    offset: int = Field(0, ge=0)
 
 # Configuration
 router = APIRouter()
-MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017/")
-client = MongoClient(MONGODB_URL)
-db = client["JuryNova"]
-cohere_client = cohere.Client(os.getenv("COHERE_API_KEY"))
+MAX_BULK_ROWS = int(os.getenv("MAX_BULK_ROWS", "5000"))
+MAX_PAGE_SIZE = 200
+# Candidates each search signal contributes before fusion; deeper pages are not served
+SEARCH_CANDIDATES = 200
+# Reciprocal rank fusion constant: damps the influence of the very top ranks
+RRF_K = 60
+
+# Fields the project cards on the home page need
+CARD_FIELDS = {"title": 1, "shortDescription": 1, "theme": 1, "isReviewed": 1}
+
+# Column names used by the CSV template, mapped to ProjectCreate fields
+CSV_COLUMNS = {
+    "Short Description": "shortDescription",
+    "Long Description": "longDescription",
+    "Github Link": "githubLink",
+    "Theme": "theme",
+}
 
 @router.get("/crud-agent")
 async def crud_agent_endpoint() -> Dict[str, str]:
@@ -49,20 +71,120 @@ async def crud_agent_endpoint() -> Dict[str, str]:
     return {"message": "Crud Agent service is running"}
 
 @router.post("/create-project")
-async def create_project(project: ProjectCreate) -> Dict[str, str]:
+async def create_project(project: ProjectCreate) -> Dict[str, Any]:
     """Create a new project and trigger related agents"""
     try:
         project_dict = project.dict()
         project_dict["isReviewed"] = False
         
-        new_project = db.projects.insert_one(project_dict)
-        project_id = str(new_project.inserted_id)
+        project_id = await insert_project(project_dict)
 
-        # Launch async tasks
-        asyncio.create_task(invoke_market_agent(project_id, project.shortDescription))
-        asyncio.create_task(invoke_code_agent(str(project.githubLink), project_id))
+        # Queue agent work; the job workers bound how much of it runs at once
+        jobs = {
+            "market_agent": await job_queue.enqueue(
+                "market_agent",
+                {"project_id": project_id, "idea": project.shortDescription},
+                project_id=project_id
+            ),
+            "code_agent": await job_queue.enqueue(
+                "code_agent",
+                {"repo_link": str(project.githubLink), "project_id": project_id},
+                project_id=project_id
+            ),
+        }
+        asyncio.create_task(search_index.index_project(project_id))
         
-        return {"message": "Project created", "project_id": project_id}
+        return {"message": "Project created", "project_id": project_id, "jobs": jobs}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def parse_bulk_rows(body: bytes, content_type: str) -> List[Dict[str, Any]]:
+    """Parse a CSV or NDJSON upload into raw rows."""
+    text = body.decode("utf-8-sig")
+    if "csv" in content_type:
+        rows = list(csv.DictReader(io.StringIO(text)))
+        return [
+            {CSV_COLUMNS.get(key.strip(), key.strip()): (value or "").strip() for key, value in row.items() if key}
+            for row in rows
+        ]
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+@router.post("/create-projects")
+async def create_projects(request: Request) -> Dict[str, Any]:
+    """Create many projects from a CSV (text/csv) or NDJSON (application/x-ndjson) body.
+
+    Valid rows are inserted with one insert_many, their descriptions are
+    embedded in batched calls and their agent jobs are queued in one write;
+    the job workers throttle how many of them run at once.
+
+    Returns:
+        Dict[str, Any]: Number of projects created and a result per row
+    """
+    try:
+        rows = parse_bulk_rows(await request.body(), request.headers.get("content-type", ""))
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse upload: {str(e)}")
+    if len(rows) > MAX_BULK_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ROWS} projects per upload")
+
+    try:
+        invalid: List[Dict[str, Any]] = []
+        valid = []
+        for row_number, row in enumerate(rows, start=1):
+            try:
+                project = ProjectCreate(**row)
+            except ValidationError as e:
+                invalid.append({"row": row_number, "status": "invalid", "errors": e.errors()})
+                continue
+            except TypeError:
+                invalid.append({"row": row_number, "status": "invalid", "errors": ["Row must be an object"]})
+                continue
+            project_dict = project.dict()
+            project_dict["githubLink"] = str(project.githubLink)
+            project_dict["isReviewed"] = False
+            valid.append((row_number, project_dict))
+
+        project_dicts = [project_dict for _, project_dict in valid]
+        project_ids = await insert_projects(project_dicts)
+
+        await job_queue.enqueue_many([
+            job
+            for project_id, project_dict in zip(project_ids, project_dicts)
+            for job in (
+                {"type": "market_agent", "project_id": project_id,
+                 "payload": {"project_id": project_id, "idea": project_dict["shortDescription"]}},
+                {"type": "code_agent", "project_id": project_id,
+                 "payload": {"repo_link": project_dict["githubLink"], "project_id": project_id}},
+            )
+        ])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    created = [
+        {"row": row_number, "status": "created", "project_id": project_id}
+        for (row_number, _), project_id in zip(valid, project_ids)
+    ]
+    results = sorted(created + invalid, key=lambda result: result["row"])
+
+    try:
+        # insert_many set each dict's _id; embed them all in batched calls
+        await search_index.embed_projects(project_dicts)
+        await search_index.project_added()
+    except Exception as e:
+        # Projects are already stored; the search index backfills them on the next warm-up
+        logger.error(f"Error embedding bulk projects: {e}")
+
+    return {"message": "Projects created", "created": len(project_ids), "results": results}
+
+@router.post("/create-hackathon")
+async def create_hackathon(hackathon: HackathonCreate) -> Dict[str, str]:
+    """Configure the hackathon's themes and required technologies.
+
+    Every worker picks the new configuration up within about a second.
+    """
+    try:
+        await save_hackathon(hackathon.dict())
+        return {"message": "Hackathon created"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -83,75 +205,239 @@ async def get_project(project_id: str) -> Dict[str, Any]:
         if not ObjectId.is_valid(project_id):
             raise HTTPException(status_code=400, detail="Invalid project ID format")
             
-        project = db.projects.find_one({"_id": ObjectId(project_id)})
+        project = await find_project(project_id, INDEX_FIELDS)
         if not project:
             raise HTTPException(status_code=404, detail="Project not found")
             
-        project["_id"] = str(project["_id"])
-        return {"message": "successful", "project": project}
+        return {"message": "successful", "project": serialize(project)}
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
+async def stream_projects(query: Dict[str, Any], projection: Dict[str, Any]) -> AsyncIterator[str]:
+    """Yield matching projects as NDJSON lines without materializing them."""
+    cursor = get_db().projects.find(query, projection).sort("_id", -1).batch_size(MAX_PAGE_SIZE)
+    async for project in cursor:
+        yield json.dumps(serialize(project), default=str) + "\n"
+
 @router.get("/get-all")
-async def get_all_projects() -> Dict[str, Any]:
-    """Retrieve all projects in reverse chronological order
+async def get_all_projects(
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    theme: Optional[str] = None,
+    isReviewed: Optional[bool] = None,
+    view: str = Query("card", regex="^(card|full)$"),
+    format: str = Query("json", regex="^(json|ndjson)$"),
+) -> Any:
+    """Retrieve projects in reverse chronological order, one page at a time
     
+    Args:
+        limit (int): Page size
+        cursor (str): next_cursor of the previous page; omit for the first page
+        theme (str): Only projects with this theme
+        isReviewed (bool): Only reviewed or only unreviewed projects
+        view (str): "card" for the fields list views need, "full" for whole documents
+        format (str): "ndjson" streams every matching project for exports, ignoring paging
+        
     Returns:
-        Dict[str, Any]: Dictionary containing list of projects and success message
+        Dict[str, Any]: Dictionary containing the page of projects, the cursor of
+        the next page (None on the last page) and success message
         
     Raises:
-        HTTPException: 500 for server errors
+        HTTPException: 400 for an invalid cursor, 500 for server errors
     """
+    query: Dict[str, Any] = {}
+    if theme is not None:
+        query["theme"] = theme
+    if isReviewed is not None:
+        query["isReviewed"] = isReviewed
+    projection = CARD_FIELDS if view == "card" else INDEX_FIELDS
+
+    if format == "ndjson":
+        return StreamingResponse(stream_projects(query, projection), media_type="application/x-ndjson")
+
+    if cursor is not None:
+        if not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query["_id"] = {"$lt": ObjectId(cursor)}
+
     try:
-        projects = list(db.projects.find({}).sort("_id", -1))  # Sort by _id desc
-        for project in projects:
-            project["_id"] = str(project["_id"])
-        return {"message": "successful", "projects": projects}
+        # One extra document tells whether another page exists
+        projects = await find_projects(query, projection, sort=[("_id", -1)], limit=limit + 1)  # Sort by _id desc
+        next_cursor = str(projects[limit - 1]["_id"]) if len(projects) > limit else None
+        projects = [serialize(project) for project in projects[:limit]]
+        return {"message": "successful", "projects": projects, "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
 
+def split_technologies(technologies: List[str]) -> Tuple[List[str], List[str]]:
+    """Split requested technologies into languages the code agent detects and everything else."""
+    from repo_mirror import LANGUAGE_FILENAMES, LANGUAGES
+    known = {language.lower() for language in (*LANGUAGES.values(), *LANGUAGE_FILENAMES.values())}
+    languages = [t for t in technologies if t.lower() in known]
+    return languages, [t for t in technologies if t.lower() not in known]
+
+def search_filters(query: SearchQuery) -> Dict[str, Any]:
+    """Mongo filter for a search's theme, review status and technologies.
+
+    Technologies that are languages are matched case-insensitively against
+    the languages the code agent detected; frameworks and tools are left to
+    the text query, see search_projects.
+    """
+    filters: Dict[str, Any] = {}
+    if query.theme is not None:
+        filters["theme"] = query.theme
+    if query.isReviewed is not None:
+        filters["isReviewed"] = query.isReviewed
+    languages, _ = split_technologies(query.technologies)
+    if languages:
+        filters["$expr"] = {"$setIsSubset": [
+            [t.lower() for t in languages],
+            {"$map": {
+                "input": {"$objectToArray": {"$ifNull": ["$codeAgentLanguages", {}]}},
+                "in": {"$toLower": "$$this.k"},
+            }},
+        ]}
+    return filters
+
+async def text_candidates(text: str, filters: Dict[str, Any]) -> List[str]:
+    """Ids of filtered projects matching the query words, best text score first."""
+    projects = await find_projects(
+        {**filters, "$text": {"$search": text}},
+        {"_id": 1, "score": {"$meta": "textScore"}},
+        sort=[("score", {"$meta": "textScore"})],
+        limit=SEARCH_CANDIDATES
+    )
+    return [str(p["_id"]) for p in projects]
+
+async def vector_candidates(vector: List[float], filters: Dict[str, Any]) -> List[str]:
+    """Ids of filtered projects closest to the query vector.
+
+    Filtered searches score only the matching projects, exactly, from the
+    in-memory description matrix; unfiltered ones use the ANN index.
+    """
+    if not filters:
+        return await search_index.query(vector, SEARCH_CANDIDATES)
+    matching = await find_projects(filters, {"_id": 1})
+    await description_matrix.sync()
+    ranked = description_matrix.rank(vector, [str(p["_id"]) for p in matching], SEARCH_CANDIDATES)
+    return [project_id for project_id, _ in ranked]
+
+def fuse(*rankings: List[str]) -> List[str]:
+    """Merge rankings by reciprocal rank fusion."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, project_id in enumerate(ranking):
+            scores[project_id] = scores.get(project_id, 0) + 1 / (RRF_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
+
 @router.post("/search")
 async def search_projects(query: SearchQuery) -> Dict[str, Any]:
-    """Search projects using semantic similarity"""
+    """Search projects by text and semantic similarity, within optional filters
+    
+    Args:
+        query (SearchQuery): Query text, optional theme, isReviewed and
+            technologies filters, and the page's limit and offset
+        
+    Returns:
+        Dict[str, Any]: Dictionary containing the page of projects, the offset
+        of the next page (None on the last page) and success message
+        
+    Raises:
+        HTTPException: 500 for server errors
+    """
     try:
-        # Fetch all projects
-        projects = list(db.projects.find({}))
-        for project in projects:
-            project["_id"] = str(project["_id"])
-
-        # Create document embeddings
-        docs = [f"Project Description: {p['longDescription']} Hackathon Theme: {p['theme']}" 
-               for p in projects]
-
-        # Generate embeddings using Cohere
-        embeds = cohere_client.embed(
-            texts=docs,
-            model="large",
-            truncate="RIGHT"
-        ).embeddings
-
-        # Build search index
-        search_index = AnnoyIndex(len(embeds[0]), 'angular')
-        for i, embed in enumerate(embeds):
-            search_index.add_item(i, embed)
-        search_index.build(10)
-
-        # Search for similar projects
-        query_embed = cohere_client.embed(
-            texts=[query.query],
-            model="large",
-            truncate="RIGHT"
-        ).embeddings
-
-        similar_indices, _ = search_index.get_nns_by_vector(
-            query_embed[0], 
-            10, 
-            include_distances=True
-        )
+        filters = search_filters(query)
+        # Frameworks and tools are not detected in the code, but usually named in the descriptions
+        _, tools = split_technologies(query.technologies)
+        text = " ".join([query.query, *tools])
+        loop = asyncio.get_running_loop()
+
+        async def semantic() -> List[str]:
+            with span("search", "embed_query"):
+                query_embed = await loop.run_in_executor(None, embed_texts, [query.query])
+            with span("search", "vector_query", filtered=bool(filters)):
+                return await vector_candidates(query_embed[0], filters)
+
+        async def lexical() -> List[str]:
+            with span("search", "text_query", filtered=bool(filters)):
+                return await text_candidates(text, filters)
+
+        # The text query runs while the query is being embedded
+        vector_ids, text_ids = await asyncio.gather(semantic(), lexical())
+        ranked = fuse(vector_ids, text_ids)
+        page_ids = ranked[query.offset:query.offset + query.limit]
+
+        with span("search", "fetch", results=len(page_ids)):
+            projects = {
+                str(p["_id"]): p
+                for p in await find_projects(
+                    {"_id": {"$in": [ObjectId(i) for i in page_ids]}},
+                    INDEX_FIELDS
+                )
+            }
+        similar_projects = [serialize(projects[i]) for i in page_ids if i in projects]
+        next_offset = query.offset + query.limit if len(ranked) > query.offset + query.limit else None
+        return {"message": "successful", "projects": similar_projects, "next_offset": next_offset}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/similar/{project_id}")
+async def get_similar_projects(
+    project_id: str,
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    code_threshold: float = Query(CODE_THRESHOLD, ge=0, le=1),
+    description_threshold: float = Query(DESCRIPTION_THRESHOLD, ge=0, le=1),
+) -> Dict[str, Any]:
+    """Find projects whose code or description overlaps with a project's
+    
+    Args:
+        project_id (str): The project to compare against
+        limit (int): Maximum number of projects returned
+        code_threshold (float): Minimum estimated Jaccard similarity of normalized source shingles
+        description_threshold (float): Minimum cosine similarity of description embeddings
         
-        similar_projects = [projects[i] for i in similar_indices]
+    Returns:
+        Dict[str, Any]: Dictionary containing the overlapping projects, most similar
+        first, each with its code and description similarity, and success message
+        
+    Raises:
+        HTTPException: 404 if project not found, 400 if invalid ID format, 500 for server errors
+    """
+    if not ObjectId.is_valid(project_id):
+        raise HTTPException(status_code=400, detail="Invalid project ID format")
+    try:
+        project = await find_project(project_id, {"codeSignature": 1})
+        if not project:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+        with span("similar", "code"):
+            code = dict(await similar_code(project, code_threshold))
+        with span("similar", "description"):
+            await description_matrix.sync()
+            description = dict(description_matrix.nearest(project_id, limit, description_threshold))
+
+        ranked = sorted(
+            set(code) | set(description),
+            key=lambda i: max(code.get(i, 0), description.get(i, 0)),
+            reverse=True
+        )[:limit]
+        with span("similar", "fetch", results=len(ranked)):
+            projects = {
+                str(p["_id"]): p
+                for p in await find_projects({"_id": {"$in": [ObjectId(i) for i in ranked]}}, CARD_FIELDS)
+            }
+        similar_projects = [
+            {
+                **serialize(projects[i]),
+                "codeSimilarity": code.get(i),
+                "descriptionSimilarity": description.get(i),
+            }
+            for i in ranked if i in projects
+        ]
         return {"message": "successful", "projects": similar_projects}
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
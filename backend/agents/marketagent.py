@@ -1,21 +1,24 @@
 import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from fastapi import APIRouter, HTTPException
-from langchain.agents import initialize_agent, Tool, AgentType
-from langchain.tools import DuckDuckGoSearchRun
-from langchain.llms import VertexAI
-from pymongo import MongoClient
-from bson.objectid import ObjectId
-import vertexai
-from vertexai.language_models import TextGenerationModel
-from typing import List, Dict
+from typing import TYPE_CHECKING, List
 from pydantic import BaseModel
+from db import get_hackathon, update_project
+from metrics import span
+from search_index import search_index
+from search_cache import CachedSearch, search
+
+# langchain is imported on first use, not at server start
+if TYPE_CHECKING:
+    from llm_gateway import GatewayLLM
+
+logger = logging.getLogger(__name__)
 
 # Constants
-MONGODB_URL = "mongodb://localhost:27017/"
-DATABASE_NAME = "JuryNova"
-PROJECT_ID = "lofty-bolt-383703"
-LOCATION = "us-central1"
 MODEL_NAME = "text-bison@001"
+QUESTION_CONCURRENCY = int(os.getenv("MARKET_QUESTION_CONCURRENCY", "10"))
 
 # Model definitions
 class MarketAnalysis(BaseModel):
@@ -24,8 +27,9 @@ class MarketAnalysis(BaseModel):
 
 # Configuration
 router = APIRouter()
-client = MongoClient(MONGODB_URL)
-db = client[DATABASE_NAME]
+
+# Agent runs are synchronous; a bounded pool keeps them off the event loop
+question_executor = ThreadPoolExecutor(max_workers=QUESTION_CONCURRENCY)
 
 # Vertex AI parameters
 GENERATION_PARAMS = {
@@ -50,13 +54,14 @@ async def marketagent_endpoint():
 
 async def get_hackathon_details() -> tuple:
     """Fetch hackathon details from database."""
-    hackathon = db.hackathons.find_one()
+    hackathon = await get_hackathon()
     if not hackathon:
-        raise HTTPException(status_code=404, message="No hackathon found")
+        raise HTTPException(status_code=404, detail="No hackathon found")
     return hackathon.get("technologies", []), hackathon.get("theme", "")
 
-async def get_market_analysis(llm: VertexAI, search_tool: DuckDuckGoSearchRun, idea: str) -> List[MarketAnalysis]:
-    """Generate market analysis for the given idea."""
+async def get_market_analysis(llm: "GatewayLLM", search_tool: CachedSearch, idea: str) -> List[MarketAnalysis]:
+    """Generate market analysis for the given idea, asking all questions concurrently."""
+    from langchain.agents import initialize_agent, Tool, AgentType
     tools = [Tool(
         name="Intermediate Answer",
         func=search_tool.run,
@@ -88,16 +93,17 @@ async def get_market_analysis(llm: VertexAI, search_tool: DuckDuckGoSearchRun, i
             
             Provide your market analysis:
             """.format(question=question, idea=idea)
-            return agent.run(prompt)
+            loop = asyncio.get_running_loop()
+            with span("market_agent", "question"):
+                return await loop.run_in_executor(question_executor, agent.run, prompt)
 
-    analyses = []
-    for question in MARKET_QUESTIONS:
-        answer = await analyze_question(question)
-        analyses.append(MarketAnalysis(question=question, answer=answer))
-    
-    return analyses
+    answers = await asyncio.gather(*(analyze_question(question) for question in MARKET_QUESTIONS))
+    return [
+        MarketAnalysis(question=question, answer=answer)
+        for question, answer in zip(MARKET_QUESTIONS, answers)
+    ]
 
-async def get_theme_match(model: TextGenerationModel, idea: str, theme: str) -> str:
+async def get_theme_match(model: "GatewayLLM", idea: str, theme: str) -> str:
     """Determine the matching theme for the idea."""
     theme_prompt = """
     Themes : {theme}
@@ -109,44 +115,44 @@ async def get_theme_match(model: TextGenerationModel, idea: str, theme: str) ->
     3. If the idea does not match any of the themes, just say "None"
     """.format(theme=theme, idea=idea)
     
-    response = await model.predict(theme_prompt, **GENERATION_PARAMS)
-    return response.text
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(question_executor, model.predict, theme_prompt)
 
 async def invoke_market_agent(project_id: str, idea: str):
     """Main function to analyze market potential and theme matching."""
     try:
-        # Initialize Vertex AI
-        vertexai.init(project=PROJECT_ID, location=LOCATION)
-        
+        from llm_gateway import gateway
+
         # Get hackathon details
         technologies, theme = await get_hackathon_details()
         
         # Initialize tools
-        llm = VertexAI()
-        search_tool = DuckDuckGoSearchRun()
-        
-        # Get market analysis
-        market_analysis = await get_market_analysis(llm, search_tool, idea)
+        llm = gateway.llm()
+        # Get market analysis; search results are cached across projects
+        with span("market_agent", "analysis", project_id=project_id):
+            market_analysis = await get_market_analysis(llm, search, idea)
         
         # Get theme matching
-        model = TextGenerationModel.from_pretrained(MODEL_NAME)
-        final_theme = await get_theme_match(model, idea, theme)
+        model = gateway.llm(MODEL_NAME, **GENERATION_PARAMS)
+        with span("market_agent", "theme_match", project_id=project_id):
+            final_theme = await get_theme_match(model, idea, theme)
         
         # Update database
-        query = {"_id": ObjectId(project_id)}
         newvalues = {
-            "$set": {
-                "marketAgentAnalysis": [analysis.dict() for analysis in market_analysis],
-                "theme": final_theme
-            }
+            "marketAgentAnalysis": [analysis.dict() for analysis in market_analysis],
+            "theme": final_theme
         }
         
-        result = db.projects.update_one(query, newvalues)
-        if not result.modified_count:
-            raise HTTPException(status_code=404, message=f"Project {project_id} not found")
+        with span("market_agent", "save", project_id=project_id):
+            if not await update_project(project_id, newvalues):
+                raise HTTPException(status_code=404, detail=f"Project {project_id} not found")
+
+        # The matched theme is part of the indexed text, so refresh the embedding
+        with span("market_agent", "embed", project_id=project_id):
+            await search_index.index_project(project_id)
         
-        print("Market Agent: Task Complete")
+        logger.info(f"Market analysis saved for project {project_id}")
         
     except Exception as e:
-        print(f"Error in market agent: {str(e)}")
-        raise HTTPException(status_code=500, message=str(e))
\ No newline at end of file
+        logger.exception(f"Error in market agent for project {project_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
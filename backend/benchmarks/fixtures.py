@@ -0,0 +1,77 @@
+import random
+from pathlib import Path
+from typing import Any, Dict, List
+
+from git import Actor, Repo
+
+THEMES = ["Healthcare", "Education", "FinTech", "Sustainability", "Developer Tools", "Social Good"]
+TECHNOLOGIES = "Python, FastAPI, MongoDB, Svelte, Vertex AI"
+
+WORDS = (
+    "platform app students doctors patients carbon energy budget payments wallet api "
+    "dashboard analytics realtime chat assistant model prediction recommendation map "
+    "community volunteers donations learning quiz tutor code review deploy cloud "
+    "sensor iot farm water waste recycling transit accessibility voice vision search"
+).split()
+
+AUTHOR = Actor("JuryNova Bench", "bench@jurynova.local")
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_project(rng: random.Random, repo_link: str, index: int) -> Dict[str, Any]:
+    """A submission shaped like the ones the CSV upload creates."""
+    return {
+        "title": f"Project {index}",
+        "shortDescription": sentence(rng, 12),
+        "longDescription": " ".join(sentence(rng, 15) for _ in range(6)),
+        "githubLink": repo_link,
+        "theme": rng.choice(THEMES),
+        "isReviewed": rng.random() < 0.3,
+    }
+
+
+def _python_module(rng: random.Random, name: str) -> str:
+    functions = "\n\n".join(
+        f"def {rng.choice(WORDS)}_{i}(value):\n"
+        f"    \"\"\"{sentence(rng, 8)}\"\"\"\n"
+        f"    return [item for item in value if item]  # {sentence(rng, 5)}\n"
+        for i in range(rng.randint(5, 20))
+    )
+    return f"\"\"\"{name}: {sentence(rng, 10)}\"\"\"\nimport os\n\n{functions}"
+
+
+def _javascript_module(rng: random.Random) -> str:
+    return "\n".join(
+        f"export function {rng.choice(WORDS)}{i}(input) {{ return input.map((x) => x * {i}); }} // {sentence(rng, 6)}"
+        for i in range(rng.randint(5, 20))
+    )
+
+
+def make_repo(path: Path, rng: random.Random, files: int = 12) -> str:
+    """Create a small committed repository and return its file:// URL.
+
+    file:// (rather than a plain path) makes git honour the shallow clone
+    depth, the same as for a GitHub remote.
+    """
+    repo = Repo.init(path)
+    paths: List[str] = ["README.md", "requirements.txt", "frontend/package-lock.json"]
+    (path / "README.md").write_text(f"# {sentence(rng, 4)}\n\n{sentence(rng, 40)}\n")
+    (path / "requirements.txt").write_text("fastapi\npymongo\nlangchain\n")
+    (path / "frontend").mkdir()
+    (path / "frontend" / "package-lock.json").write_text("{}\n")  # Excluded by the ingestion filters
+    for i in range(files):
+        if i % 3 == 2:
+            relative = f"frontend/src/{rng.choice(WORDS)}_{i}.js"
+            content = _javascript_module(rng)
+        else:
+            relative = f"app/{rng.choice(WORDS)}_{i}.py"
+            content = _python_module(rng, relative)
+        (path / relative).parent.mkdir(parents=True, exist_ok=True)
+        (path / relative).write_text(content)
+        paths.append(relative)
+    repo.index.add(paths)
+    repo.index.commit("Initial commit", author=AUTHOR, committer=AUTHOR)
+    return path.resolve().as_uri()
@@ -0,0 +1,319 @@
+"""Offline end-to-end benchmarks for the JuryNova API and agent pipelines.
+
+Every external service is replaced by a local stand-in: MongoDB by a
+throwaway database on a local mongod (or mongomock-motor), Vertex AI,
+Cohere/OpenAI embeddings, DuckDuckGo and ElevenLabs by the stub backends
+with configurable latency, and GitHub by generated file:// repositories.
+
+Each project count runs in its own process against fresh state:
+
+    cd backend
+    python -m benchmarks.run --sizes 10 100 1000 --output results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PRODUCTION_DATABASE = "JuryNova"
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="project counts")
+    parser.add_argument("--requests", type=int, default=200, help="requests per API scenario")
+    parser.add_argument("--concurrency", type=int, default=10, help="requests in flight per API scenario")
+    parser.add_argument("--chat-requests", type=int, default=50)
+    parser.add_argument("--create-requests", type=int, default=50)
+    parser.add_argument("--pipeline-projects", type=int, default=0,
+                        help="projects to run both agents on (default: all)")
+    parser.add_argument("--repos", type=int, default=20, help="distinct fixture repositories")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per stub LLM call")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per stub embedding call")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="seconds per stub web search")
+    parser.add_argument("--tts-latency", type=float, default=0.01, help="seconds per stub TTS chunk")
+    parser.add_argument("--llm-cache", action="store_true", help="keep the LLM prompt cache enabled")
+    parser.add_argument("--mongo", choices=["mongod", "mock"], default="mongod",
+                        help="local mongod at MONGODB_URL, or in-process mongomock-motor "
+                             "(skips the search scenarios)")
+    parser.add_argument("--database", default="JuryNovaBench")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the results as JSON")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", type=Path, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def configure(args: argparse.Namespace, workdir: Path) -> None:
+    """Point every service at its local stand-in; must run before app modules are imported."""
+    (workdir / "search.json").write_text("{}")
+    os.environ.update({
+        "DATABASE_NAME": args.database,
+        "LLM_BACKEND": "stub",
+        "STUB_LLM_LATENCY": str(args.llm_latency),
+        "LLM_CACHE_PATH": str(workdir / "llm_cache.sqlite"),
+        "EMBED_CACHE_PATH": str(workdir / "embed_cache.sqlite"),
+        "EMBED_BACKEND": "stub",
+        "STUB_EMBED_LATENCY": str(args.embed_latency),
+        "SEARCH_BACKEND": f"file:{workdir / 'search.json'}",
+        "FILE_SEARCH_LATENCY": str(args.search_latency),
+        "TTS_BACKEND": "stub",
+        "STUB_TTS_LATENCY": str(args.tts_latency),
+        "SEARCH_INDEX_DIR": str(workdir / "search_index"),
+        "CHROMA_DIR": str(workdir / "chroma"),
+        "TTS_CACHE_DIR": str(workdir / "tts_cache"),
+        "PROJECT_DIR": str(workdir / "projects_source_code"),
+    })
+    if not args.llm_cache:
+        os.environ["LLM_CACHE_TTL"] = "0"  # Nothing is ever fresh enough to be served
+    # The chat agent resolves its source directory relative to the working directory
+    os.chdir(workdir)
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+def summarize(name: str, latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    return {
+        "scenario": name,
+        "count": len(latencies),
+        "errors": errors,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000) if latencies else None,
+        "p99_ms": float(np.percentile(latencies, 99) * 1000) if latencies else None,
+        "throughput": len(latencies) / elapsed if elapsed else None,
+    }
+
+
+async def measure(name: str, request: Callable[[int], Awaitable[Optional[float]]], count: int,
+                  concurrency: int) -> Dict[str, Any]:
+    """Run count requests with at most concurrency in flight.
+
+    A request may return its own latency in seconds, such as the time to its
+    first streamed token; otherwise the whole call is timed.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                latency = await request(i)
+            except Exception as e:
+                errors += 1
+                print(f"{name} request {i} failed: {e}", file=sys.stderr)
+            else:
+                latencies.append(latency if latency is not None else time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return summarize(name, latencies, errors, time.perf_counter() - start)
+
+
+async def run_size(args: argparse.Namespace, size: int, workdir: Path) -> List[Dict[str, Any]]:
+    import httpx
+
+    import db
+    from benchmarks.fixtures import TECHNOLOGIES, THEMES, WORDS, make_project, make_repo
+    from server import app, invoke_code_agent, invoke_market_agent
+    from agents.chatagent import get_chat_agent
+    from jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, job_queue
+    from search_index import search_index
+
+    if args.mongo == "mock":
+        from mongomock_motor import AsyncMongoMockClient
+        db._client = AsyncMongoMockClient()
+    await db.connect()
+    await db.get_db().client.drop_database(args.database)
+    await db.ensure_indexes()
+
+    rng = random.Random(args.seed)
+    repos = [make_repo(workdir / "fixtures" / f"repo-{i}", rng) for i in range(min(args.repos, size))]
+    projects = [make_project(rng, repos[i % len(repos)], i) for i in range(size)]
+    project_ids = await db.insert_projects(projects)
+    await db.save_hackathon({"theme": ", ".join(THEMES), "technologies": TECHNOLOGIES})
+    await search_index.embed_projects(projects)
+    await search_index.rebuild()
+
+    results = []
+    client = httpx.AsyncClient(app=app, base_url="http://bench", timeout=None)
+
+    async def get_all(i: int) -> None:
+        params = [{}, {"theme": THEMES[i % len(THEMES)]}, {"isReviewed": "false"}][i % 3]
+        response = await client.get("/api/get-all", params={"limit": 50, **params})
+        response.raise_for_status()
+
+    async def search(i: int) -> None:
+        query = " ".join(rng.choice(WORDS) for _ in range(6))
+        response = await client.post("/api/search", json={"query": query})
+        response.raise_for_status()
+
+    async def search_filtered(i: int) -> None:
+        query = " ".join(rng.choice(WORDS) for _ in range(6))
+        filters = [{"theme": THEMES[i % len(THEMES)]}, {"isReviewed": False}][i % 2]
+        response = await client.post("/api/search", json={"query": query, "offset": 10 * (i % 3), **filters})
+        response.raise_for_status()
+
+    async def create_project(i: int) -> None:
+        response = await client.post("/api/create-project", json={
+            "shortDescription": f"Benchmark submission {i}",
+            "longDescription": " ".join(rng.choice(WORDS) for _ in range(60)),
+            "githubLink": f"https://github.com/jurynova-bench/project-{i}",
+            "theme": rng.choice(THEMES),
+        })
+        response.raise_for_status()
+
+    results.append(await measure("get-all", get_all, args.requests, args.concurrency))
+    if args.mongo == "mongod":
+        # mongomock has no $text support
+        results.append(await measure("search", search, args.requests, args.concurrency))
+        results.append(await measure("search-filtered", search_filtered, args.requests, args.concurrency))
+    results.append(await measure("create-project", create_project, args.create_requests, args.concurrency))
+    # Those jobs point at GitHub; only the fixture pipelines below may run
+    await db.get_db().jobs.delete_many({})
+
+    pipeline_ids = project_ids[:args.pipeline_projects or size]
+    await job_queue.enqueue_many([
+        job
+        for project_id, project in zip(pipeline_ids, projects)
+        for job in (
+            {"type": "market_agent", "project_id": project_id,
+             "payload": {"project_id": project_id, "idea": project["shortDescription"]}},
+            {"type": "code_agent", "project_id": project_id,
+             "payload": {"repo_link": project["githubLink"], "project_id": project_id}},
+        )
+    ])
+    job_queue.register("code_agent", invoke_code_agent, concurrency=2)
+    job_queue.register("market_agent", invoke_market_agent, concurrency=4)
+    start = time.perf_counter()
+    await job_queue.start()
+    while await db.get_db().jobs.count_documents({"status": {"$in": [QUEUED, RUNNING]}}):
+        await asyncio.sleep(0.5)
+    elapsed = time.perf_counter() - start
+    await job_queue.stop()
+    for job_type in ("market_agent", "code_agent"):
+        jobs = await db.get_db().jobs.find({"type": job_type}).to_list(length=None)
+        latencies = [
+            (job["updatedAt"] - job["createdAt"]).total_seconds()
+            for job in jobs if job["status"] == SUCCEEDED
+        ]
+        failed = sum(1 for job in jobs if job["status"] == FAILED)
+        results.append(summarize(f"pipeline:{job_type}", latencies, failed, elapsed))
+
+    # Shared fixture repositories make most chunks repeats; only unique ones reach the embedder
+    from vector_store import get_embeddings
+    embeddings = get_embeddings()
+    results.append({
+        **summarize("chunk-embed-misses", [], 0, 0),
+        "count": embeddings.misses,
+        "hits": embeddings.hits,
+    })
+
+    analyzed = [
+        str(p["_id"])
+        for p in await db.find_projects({"codeAgentCommit": {"$exists": True}}, {"_id": 1})
+    ] or project_ids
+
+    # One multi-turn conversation per concurrent judge, so summaries get folded in
+    sessions = []
+    for i in range(args.concurrency):
+        response = await client.post("/api/chat-agent/sessions", json={"project_id": analyzed[i % len(analyzed)]})
+        response.raise_for_status()
+        sessions.append(response.json()["session_id"])
+
+    def chat_request(i: int) -> Dict[str, Any]:
+        return {
+            "session_id": sessions[i % len(sessions)],
+            "question": f"How well does the project handle {rng.choice(WORDS)}?",
+        }
+
+    async def chat(i: int) -> None:
+        response = await client.post("/api/chat-agent", json=chat_request(i))
+        response.raise_for_status()
+
+    async def chat_first_token(i: int) -> float:
+        # Straight from the generator: the test client buffers streamed bodies
+        start = time.perf_counter()
+        request = chat_request(i)
+        agent = get_chat_agent()
+        first_token = None
+        tokens = 0
+        async for event in agent.stream_chat(await agent.open_session(request["session_id"]), request["question"]):
+            if event.startswith("event: error"):
+                raise RuntimeError(event)
+            if event.startswith("event: token"):
+                tokens += 1
+                first_token = first_token or time.perf_counter() - start
+        # A single token event means the answer was sent whole, not streamed
+        if tokens < 2:
+            raise RuntimeError(f"answer arrived in {tokens} token event(s), not streamed")
+        return first_token
+
+    async def chat_audio(i: int) -> None:
+        response = await client.post("/api/chat-agent", json=chat_request(i))
+        response.raise_for_status()
+        audio = await client.get(response.json()["audio_url"])
+        audio.raise_for_status()
+
+    results.append(await measure("chat-turn", chat, args.chat_requests, args.concurrency))
+    results.append(await measure("chat-first-token", chat_first_token, args.chat_requests, args.concurrency))
+    results.append(await measure("chat-turn+audio", chat_audio, args.chat_requests, args.concurrency))
+
+    await client.aclose()
+    await db.get_db().client.drop_database(args.database)
+    await db.close()
+    for result in results:
+        result["projects"] = size
+    return results
+
+
+def run_child(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory(prefix="jurynova-bench-") as workdir:
+        configure(args, Path(workdir))
+        results = asyncio.run(run_size(args, args.child, Path(workdir)))
+    args.child_output.write_text(json.dumps(results))
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    print(f"{'projects':>8}  {'scenario':<22}{'count':>7}{'errors':>7}{'p50 ms':>10}{'p99 ms':>10}{'per s':>9}")
+    for r in results:
+        p50 = f"{r['p50_ms']:.1f}" if r["p50_ms"] is not None else "-"
+        p99 = f"{r['p99_ms']:.1f}" if r["p99_ms"] is not None else "-"
+        throughput = f"{r['throughput']:.2f}" if r["throughput"] is not None else "-"
+        print(f"{r['projects']:>8}  {r['scenario']:<22}{r['count']:>7}{r['errors']:>7}{p50:>10}{p99:>10}{throughput:>9}")
+
+
+def main(argv: List[str]) -> None:
+    args = parse_args(argv)
+    if args.child is not None:
+        run_child(args)
+        return
+    if args.database == PRODUCTION_DATABASE:
+        sys.exit("Refusing to benchmark against the production database; it is dropped between runs")
+
+    results: List[Dict[str, Any]] = []
+    for size in args.sizes:
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            # A fresh process per size, so module-level caches and indexes start empty
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.run", *argv, "--child", str(size), "--child-output", output.name],
+                cwd=BACKEND_DIR, check=True
+            )
+            results.extend(json.loads(Path(output.name).read_text()))
+    print_table(results)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,87 @@
+"""Server cold-start benchmark: import time and per-worker memory.
+
+Each run is a fresh interpreter that imports ``server`` (what every uvicorn
+worker and every --reload cycle pays) and then runs the background pre-warm
+(what the first agent request would otherwise pay):
+
+    cd backend
+    python -m benchmarks.startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+CHILD = """
+import json, resource, sys, time
+sys.path.insert(0, {backend!r})
+
+def rss_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+start = time.perf_counter()
+import server
+imported = time.perf_counter()
+import_rss = rss_mb()
+server.prewarm()
+warmed = time.perf_counter()
+print(json.dumps({{
+    "import_s": imported - start,
+    "import_rss_mb": import_rss,
+    "prewarm_s": warmed - imported,
+    "prewarm_rss_mb": rss_mb(),
+    "modules": len(sys.modules),
+}}))
+"""
+
+
+def run_once(workdir: Path) -> Dict[str, float]:
+    env = {
+        **os.environ,
+        # Stub providers: pre-warming builds clients but must not need credentials
+        "LLM_BACKEND": "stub",
+        "EMBED_BACKEND": "stub",
+        "TTS_BACKEND": "stub",
+        "LLM_CACHE_PATH": str(workdir / "llm_cache.sqlite"),
+        "EMBED_CACHE_PATH": str(workdir / "embed_cache.sqlite"),
+        "TTS_CACHE_DIR": str(workdir / "tts_cache"),
+        "SEARCH_INDEX_DIR": str(workdir / "search_index"),
+        "CHROMA_DIR": str(workdir / "chroma"),
+    }
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(backend=str(BACKEND_DIR))],
+        cwd=workdir, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", type=Path, help="write the medians as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="jurynova-startup-") as workdir:
+        runs = [run_once(Path(workdir)) for _ in range(args.runs)]
+    medians = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+    print(f"import server     {medians['import_s']:8.2f} s  {medians['import_rss_mb']:8.1f} MB RSS")
+    print(f"+ background warm {medians['prewarm_s']:8.2f} s  {medians['prewarm_rss_mb']:8.1f} MB RSS")
+    print(f"modules loaded    {medians['modules']:8.0f}")
+    if args.output:
+        args.output.write_text(json.dumps({"runs": runs, "median": medians}, indent=2))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from db import CHAT_SESSION_TTL, get_db
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CHAT_WINDOW_TURNS = int(os.getenv("CHAT_WINDOW_TURNS", "4"))
+CHAT_SESSION_CACHE_SIZE = int(os.getenv("CHAT_SESSION_CACHE_SIZE", "256"))
+
+# Folds the running summary and older turns into a new summary; blocking
+Summarizer = Callable[[str, str], str]
+
+
+def format_turns(turns: List[Dict[str, str]]) -> str:
+    return "\n".join(f"Human: {t['input']}\nAI: {t['output']}" for t in turns)
+
+
+class ChatSession:
+    """One judge's conversation about a project.
+
+    Recent turns are kept verbatim, between CHAT_WINDOW_TURNS and twice as
+    many; older ones live on in a running summary. The session also caches
+    the project and the conversation chain built for it, so a turn does not
+    rebuild them; only the project's analyzed commit is re-read every turn.
+    """
+
+    def __init__(self, document: Dict[str, Any], project: Dict[str, Any]):
+        self.id: str = document["_id"]
+        self.project = project
+        self.summary: str = document.get("summary", "")
+        self.turns: List[Dict[str, str]] = document.get("turns", [])
+        self.turn_count: int = document.get("turnCount", 0)
+        self.conversation: Any = None
+        self.conversation_key: Any = None
+        self.compacting = False
+        # Turns of one session run one at a time, in order
+        self.lock = asyncio.Lock()
+
+    def history(self) -> str:
+        """The conversation so far, as it goes into the prompt."""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation: {self.summary}")
+        if self.turns:
+            parts.append(format_turns(self.turns))
+        return "\n".join(parts)
+
+
+class SessionStore:
+    """Chat sessions in Mongo with an in-process LRU of open sessions.
+
+    Mongo is the source of truth and expires idle sessions through the TTL
+    index on updatedAt. Writes are conditional on turnCount, so when another
+    worker advanced a session, the cached copy is dropped and reloaded.
+    """
+
+    def __init__(self, max_size: int = CHAT_SESSION_CACHE_SIZE):
+        self.max_size = max_size
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._used: Dict[str, float] = {}
+
+    def _remember(self, session: ChatSession) -> None:
+        self._sessions[session.id] = session
+        self._sessions.move_to_end(session.id)
+        self._used[session.id] = time.monotonic()
+        while len(self._sessions) > self.max_size:
+            evicted, _ = self._sessions.popitem(last=False)
+            self._used.pop(evicted, None)
+
+    def forget(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+        self._used.pop(session_id, None)
+
+    async def create(self, project: Dict[str, Any]) -> ChatSession:
+        now = datetime.utcnow()
+        document = {
+            "_id": uuid.uuid4().hex,
+            "projectId": str(project["_id"]),
+            "summary": "",
+            "turns": [],
+            "turnCount": 0,
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        await get_db().chat_sessions.insert_one(document)
+        session = ChatSession(document, project)
+        self._remember(session)
+        return session
+
+    async def get(self, session_id: str, load_project: Callable) -> Optional[ChatSession]:
+        """The open session, loaded from Mongo on a miss; None if it expired or never existed.
+
+        load_project is awaited with the project id when the session is not cached.
+        """
+        session = self._sessions.get(session_id)
+        if session is not None and time.monotonic() - self._used[session_id] < CHAT_SESSION_TTL:
+            self._remember(session)
+            return session
+        self.forget(session_id)
+
+        document = await get_db().chat_sessions.find_one({"_id": session_id})
+        if document is None:
+            return None
+        project = await load_project(document["projectId"])
+        if project is None:
+            return None
+        session = ChatSession(document, project)
+        self._remember(session)
+        return session
+
+    async def append(self, session: ChatSession, question: str, answer: str) -> None:
+        """Record a finished turn."""
+        turn = {"input": question, "output": answer}
+        result = await get_db().chat_sessions.update_one(
+            {"_id": session.id, "turnCount": session.turn_count},
+            {"$push": {"turns": turn}, "$inc": {"turnCount": 1}, "$set": {"updatedAt": datetime.utcnow()}}
+        )
+        if not result.matched_count:
+            logger.info(f"Chat session {session.id} changed elsewhere or expired; reloading it next turn")
+            self.forget(session.id)
+            return
+        session.turns.append(turn)
+        session.turn_count += 1
+
+    async def compact(self, session: ChatSession, summarize: Summarizer) -> None:
+        """Fold all but the last CHAT_WINDOW_TURNS turns into the summary.
+
+        Runs once the window has doubled, so the summarizer is called once
+        every CHAT_WINDOW_TURNS turns rather than on every turn. The session
+        is only locked to take a snapshot and to apply the result, so the
+        next turn does not wait for the summary.
+        """
+        async with session.lock:
+            if session.compacting or len(session.turns) < 2 * CHAT_WINDOW_TURNS:
+                return
+            session.compacting = True
+            summary, folded = session.summary, session.turns[:-CHAT_WINDOW_TURNS]
+        try:
+            loop = asyncio.get_running_loop()
+            try:
+                summary = await loop.run_in_executor(None, summarize, summary, format_turns(folded))
+            except Exception as e:
+                logger.error(f"Error summarizing chat session {session.id}: {e}")
+                return
+            async with session.lock:
+                # Turns finished while summarizing stay in the window
+                kept = session.turns[len(folded):]
+                result = await get_db().chat_sessions.update_one(
+                    {"_id": session.id, "turnCount": session.turn_count},
+                    {"$set": {"summary": summary, "turns": kept}}
+                )
+                if not result.matched_count:
+                    self.forget(session.id)
+                    return
+                session.summary, session.turns = summary, kept
+        finally:
+            session.compacting = False
+
+
+chat_sessions = SessionStore()
@@ -1,5 +1,186 @@
-from pymongo import MongoClient
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
 
-def get_database_connection():
-    client = MongoClient("mongodb://localhost:27017/")
-    return client["mydatabase"]
\ No newline at end of file
+from bson import ObjectId
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import OperationFailure
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017/")
+DATABASE_NAME = os.getenv("DATABASE_NAME", "JuryNova")
+POOL_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGODB_MAX_POOL_SIZE", "100")),
+    "minPoolSize": int(os.getenv("MONGODB_MIN_POOL_SIZE", "5")),
+    "maxIdleTimeMS": int(os.getenv("MONGODB_MAX_IDLE_MS", "60000")),
+    "waitQueueTimeoutMS": int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "10000")),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+}
+
+CHAT_AUDIO_TTL = 24 * 3600
+# Idle seconds before a chat session expires
+CHAT_SESSION_TTL = int(os.getenv("CHAT_SESSION_TTL", str(2 * 3600)))
+HACKATHON_POLL_INTERVAL = float(os.getenv("HACKATHON_POLL_INTERVAL", "1"))
+
+_client: Optional[AsyncIOMotorClient] = None
+_hackathon: Optional[Dict[str, Any]] = None
+_hackathon_watch: Optional[asyncio.Task] = None
+
+
+async def connect() -> None:
+    """Open the application's single connection pool; called at startup."""
+    global _client
+    if _client is None:
+        _client = AsyncIOMotorClient(MONGODB_URL, **POOL_OPTIONS)
+    await _client.admin.command("ping")
+    await ensure_indexes()
+    await load_hackathon()
+    global _hackathon_watch
+    if _hackathon_watch is None:
+        _hackathon_watch = asyncio.create_task(watch_hackathon())
+    logger.info(f"Connected to MongoDB database {DATABASE_NAME}")
+
+
+async def close() -> None:
+    global _client, _hackathon_watch
+    if _hackathon_watch is not None:
+        _hackathon_watch.cancel()
+        _hackathon_watch = None
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+async def ensure_indexes() -> None:
+    """Indexes backing the project list filters, search, similarity lookups and expiring chat data."""
+    await get_db().chat_audio.create_index("createdAt", expireAfterSeconds=CHAT_AUDIO_TTL)
+    await get_db().chat_sessions.create_index("updatedAt", expireAfterSeconds=CHAT_SESSION_TTL)
+    projects = get_db().projects
+    await projects.create_index([("theme", ASCENDING), ("_id", DESCENDING)])
+    await projects.create_index([("isReviewed", ASCENDING), ("_id", DESCENDING)])
+    await projects.create_index([("theme", ASCENDING), ("isReviewed", ASCENDING), ("_id", DESCENDING)])
+    await projects.create_index("codeBands")
+    await projects.create_index("embeddedAt")
+    # Only the few projects embedded since the last search index rebuild are in it
+    await projects.create_index("searchIndexed", partialFilterExpression={"searchIndexed": False})
+    # A collection has at most one text index; names of technologies usually appear in the analysis
+    await projects.create_index(
+        [("title", TEXT), ("shortDescription", TEXT), ("longDescription", TEXT), ("theme", TEXT),
+         ("codeAgentAnalysis.answer", TEXT)],
+        weights={"title": 10, "shortDescription": 5, "theme": 5, "longDescription": 2, "codeAgentAnalysis.answer": 1},
+        name="project_text"
+    )
+
+
+def get_db() -> AsyncIOMotorDatabase:
+    """Database handle backed by the shared pool."""
+    global _client
+    if _client is None:
+        # Scripts and background work that run outside the app lifecycle
+        _client = AsyncIOMotorClient(MONGODB_URL, **POOL_OPTIONS)
+    return _client[DATABASE_NAME]
+
+
+def serialize(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Make a document JSON-friendly by turning its ObjectId into a string."""
+    document["_id"] = str(document["_id"])
+    return document
+
+
+# Projects
+
+async def find_project(project_id: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Fetch a project by id, or None if the id is invalid or unknown."""
+    if not ObjectId.is_valid(project_id):
+        return None
+    return await get_db().projects.find_one({"_id": ObjectId(project_id)}, projection)
+
+
+async def find_projects(query: Dict[str, Any], projection: Optional[Dict[str, Any]] = None,
+                        sort: Optional[List] = None, limit: int = 0) -> List[Dict[str, Any]]:
+    cursor = get_db().projects.find(query, projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    return await cursor.to_list(length=None)
+
+
+async def insert_project(project: Dict[str, Any]) -> str:
+    result = await get_db().projects.insert_one(project)
+    return str(result.inserted_id)
+
+
+async def insert_projects(projects: List[Dict[str, Any]]) -> List[str]:
+    """Insert many projects in one round trip; ids are returned in input order."""
+    if not projects:
+        return []
+    result = await get_db().projects.insert_many(projects)
+    return [str(project_id) for project_id in result.inserted_ids]
+
+
+async def update_project(project_id: str, fields: Dict[str, Any]) -> bool:
+    """Set fields on a project; returns whether the project exists."""
+    result = await get_db().projects.update_one({"_id": ObjectId(project_id)}, {"$set": fields})
+    return result.matched_count > 0
+
+
+# Hackathons
+#
+# The configuration is read on every chat turn and agent job but changes a
+# handful of times per event, so each worker keeps it in memory and reloads
+# it when the document changes.
+
+async def load_hackathon() -> Dict[str, Any]:
+    global _hackathon
+    _hackathon = await get_db().hackathons.find_one({}) or {}
+    return _hackathon
+
+
+async def get_hackathon() -> Dict[str, Any]:
+    """The hackathon configuration, or an empty dict if none was created."""
+    hackathon = _hackathon if _hackathon is not None else await load_hackathon()
+    return dict(hackathon)
+
+
+async def save_hackathon(fields: Dict[str, Any]) -> None:
+    """Create or replace the hackathon configuration, bumping its version for the other workers."""
+    await get_db().hackathons.update_one(
+        {},
+        {"$set": {**fields, "updatedAt": datetime.utcnow()}, "$inc": {"version": 1}},
+        upsert=True
+    )
+    await load_hackathon()
+
+
+async def watch_hackathon() -> None:
+    """Keep the cached configuration current.
+
+    Uses a change stream where the deployment supports one (replica sets),
+    otherwise polls the version counter every HACKATHON_POLL_INTERVAL seconds.
+    """
+    try:
+        async with get_db().hackathons.watch() as stream:
+            async for _ in stream:
+                await load_hackathon()
+    except OperationFailure:
+        logger.info("Change streams unavailable; polling the hackathon version")
+    except Exception as e:
+        logger.error(f"Hackathon change stream failed, polling instead: {e}")
+
+    while True:
+        await asyncio.sleep(HACKATHON_POLL_INTERVAL)
+        try:
+            current = await get_db().hackathons.find_one({}, {"version": 1})
+            if (current or {}).get("version") != (_hackathon or {}).get("version"):
+                await load_hackathon()
+        except Exception as e:
+            logger.error(f"Error polling hackathon configuration: {e}")
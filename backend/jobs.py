@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException
+from pymongo import ASCENDING, ReturnDocument
+
+from db import get_db, serialize
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Configuration
+POLL_INTERVAL = 1.0
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+BACKOFF_BASE = 10
+BACKOFF_MAX = 600
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for the given (1-based) attempt."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class JobQueue:
+    """Mongo-backed job queue with a bounded worker pool per job type.
+
+    Jobs are claimed with a lease that running workers keep renewing. A job
+    whose lease expires (its worker died or the server restarted) becomes
+    claimable again, so queued and interrupted work resumes after a restart.
+    """
+
+    def __init__(self):
+        self.handlers: Dict[str, Callable[..., Awaitable[Any]]] = {}
+        self.concurrency: Dict[str, int] = {}
+        self.gates: Dict[str, Callable[[], bool]] = {}
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._workers: List[asyncio.Task] = []
+
+    def register(self, job_type: str, handler: Callable[..., Awaitable[Any]], concurrency: int,
+                 gate: Optional[Callable[[], bool]] = None) -> None:
+        """Register a handler; its concurrency can be overridden with JOB_CONCURRENCY_<TYPE>.
+
+        While gate returns False no jobs of the type are claimed; they stay queued.
+        """
+        self.handlers[job_type] = handler
+        if gate is not None:
+            self.gates[job_type] = gate
+        self.concurrency[job_type] = int(os.getenv(f"JOB_CONCURRENCY_{job_type.upper()}", concurrency))
+
+    async def enqueue(self, job_type: str, payload: Dict[str, Any], project_id: Optional[str] = None,
+                      max_attempts: int = MAX_ATTEMPTS, dedupe: bool = False) -> str:
+        """Queue a job and return its id.
+
+        With dedupe, a job of the same type already queued or running for the
+        project is returned instead of queueing another one.
+        """
+        if dedupe:
+            active = await get_db().jobs.find_one(
+                {"type": job_type, "project_id": project_id, "status": {"$in": [QUEUED, RUNNING]}},
+                {"_id": 1}
+            )
+            if active:
+                return str(active["_id"])
+
+        now = datetime.utcnow()
+        result = await get_db().jobs.insert_one({
+            "type": job_type,
+            "payload": payload,
+            "project_id": project_id,
+            "status": QUEUED,
+            "attempts": 0,
+            "maxAttempts": max_attempts,
+            "runAfter": now,
+            "leaseUntil": None,
+            "lastError": None,
+            "createdAt": now,
+            "updatedAt": now,
+        })
+        if job_type in self._wakeups:
+            self._wakeups[job_type].set()
+        return str(result.inserted_id)
+
+    async def enqueue_many(self, jobs: List[Dict[str, Any]], max_attempts: int = MAX_ATTEMPTS) -> List[str]:
+        """Queue many jobs in one write.
+
+        Args:
+            jobs: List[Dict] - each with "type", "payload" and optionally "project_id"
+
+        Returns:
+            List[str] - job ids, in the order given
+        """
+        if not jobs:
+            return []
+        now = datetime.utcnow()
+        result = await get_db().jobs.insert_many([
+            {
+                "type": job["type"],
+                "payload": job["payload"],
+                "project_id": job.get("project_id"),
+                "status": QUEUED,
+                "attempts": 0,
+                "maxAttempts": max_attempts,
+                "runAfter": now,
+                "leaseUntil": None,
+                "lastError": None,
+                "createdAt": now,
+                "updatedAt": now,
+            }
+            for job in jobs
+        ])
+        for job_type in {job["type"] for job in jobs}:
+            if job_type in self._wakeups:
+                self._wakeups[job_type].set()
+        return [str(job_id) for job_id in result.inserted_ids]
+
+    async def start(self) -> None:
+        """Create indexes and start the workers for every registered job type."""
+        await get_db().jobs.create_index([("type", ASCENDING), ("status", ASCENDING), ("runAfter", ASCENDING)])
+        await get_db().jobs.create_index([("project_id", ASCENDING)])
+        for job_type, concurrency in self.concurrency.items():
+            self._wakeups[job_type] = asyncio.Event()
+            for _ in range(concurrency):
+                self._workers.append(asyncio.create_task(self._worker(job_type)))
+        logger.info(f"Job workers started: {self.concurrency}")
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+    async def _claim(self, job_type: str) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return await get_db().jobs.find_one_and_update(
+            {
+                "type": job_type,
+                "$or": [
+                    {"status": QUEUED, "runAfter": {"$lte": now}},
+                    {
+                        "status": RUNNING,
+                        "leaseUntil": {"$lt": now},
+                        # A job that keeps killing its worker is not retried forever
+                        "$expr": {"$lt": ["$attempts", "$maxAttempts"]},
+                    },
+                ],
+            },
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "worker": self.worker_id,
+                    "leaseUntil": now + timedelta(seconds=LEASE_SECONDS),
+                    "updatedAt": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("runAfter", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _fail_abandoned(self, job_type: str) -> None:
+        """Fail jobs whose lease expired on their last allowed attempt."""
+        now = datetime.utcnow()
+        result = await get_db().jobs.update_many(
+            {
+                "type": job_type,
+                "status": RUNNING,
+                "leaseUntil": {"$lt": now},
+                "$expr": {"$gte": ["$attempts", "$maxAttempts"]},
+            },
+            {"$set": {
+                "status": FAILED,
+                "lastError": "Worker lost on the final attempt",
+                "leaseUntil": None,
+                "updatedAt": now,
+            }}
+        )
+        if result.modified_count:
+            logger.error(f"{result.modified_count} {job_type} job(s) failed after their worker was lost")
+
+    async def _worker(self, job_type: str) -> None:
+        wakeup = self._wakeups[job_type]
+        gate = self.gates.get(job_type)
+        while True:
+            if gate is not None and not gate():
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            try:
+                job = await self._claim(job_type)
+                if job is None:
+                    await self._fail_abandoned(job_type)
+            except Exception as e:
+                logger.error(f"Error claiming {job_type} job: {e}")
+                job = None
+
+            if job is None:
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(job)
+            except Exception:
+                # Most likely the final status write; the job's lease expires and it is claimed again
+                logger.exception(f"Error finishing {job['type']} job {job['_id']}")
+
+    async def _heartbeat(self, job_id: ObjectId) -> None:
+        while True:
+            await asyncio.sleep(LEASE_SECONDS / 3)
+            try:
+                await get_db().jobs.update_one(
+                    {"_id": job_id, "worker": self.worker_id},
+                    {"$set": {"leaseUntil": datetime.utcnow() + timedelta(seconds=LEASE_SECONDS)}}
+                )
+            except Exception as e:
+                # The lease outlasts a few missed renewals; keep trying
+                logger.error(f"Error renewing lease of job {job_id}: {e}")
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        handler = self.handlers[job["type"]]
+        heartbeat = asyncio.create_task(self._heartbeat(job["_id"]))
+        try:
+            with span(job["type"], "job", job_id=str(job["_id"]), project_id=job.get("project_id"),
+                      attempt=job["attempts"]):
+                await handler(**job["payload"])
+        except Exception as e:
+            error = getattr(e, "detail", None) or f"{type(e).__name__}: {e}"
+            logger.error(f"{job['type']} job {job['_id']} failed (attempt {job['attempts']}): {error}")
+            update = {"lastError": error, "leaseUntil": None, "updatedAt": datetime.utcnow()}
+            if job["attempts"] < job["maxAttempts"]:
+                update["status"] = QUEUED
+                update["runAfter"] = datetime.utcnow() + timedelta(seconds=backoff_delay(job["attempts"]))
+            else:
+                update["status"] = FAILED
+            await get_db().jobs.update_one({"_id": job["_id"]}, {"$set": update})
+        else:
+            await get_db().jobs.update_one(
+                {"_id": job["_id"]},
+                {"$set": {"status": SUCCEEDED, "leaseUntil": None, "updatedAt": datetime.utcnow()}}
+            )
+        finally:
+            heartbeat.cancel()
+
+
+job_queue = JobQueue()
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str) -> Dict[str, Any]:
+    """Return the status of a background job."""
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID format")
+    job = await get_db().jobs.find_one({"_id": ObjectId(job_id)})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"message": "successful", "job": serialize(job)}
+
+
+@router.get("/jobs")
+async def get_project_jobs(project_id: str) -> Dict[str, Any]:
+    """Return the background jobs of a project, newest first."""
+    jobs = await get_db().jobs.find({"project_id": project_id}).sort("_id", -1).to_list(length=100)
+    return {"message": "successful", "jobs": [serialize(job) for job in jobs]}
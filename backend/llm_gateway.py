@@ -0,0 +1,299 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.llms.base import LLM
+
+from rate_limit import credit_ledger, limiters
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+LLM_BACKEND = os.getenv("LLM_BACKEND", "vertexai")  # or "stub"
+VERTEX_PROJECT = os.getenv("VERTEX_PROJECT", "lofty-bolt-383703")
+VERTEX_LOCATION = os.getenv("VERTEX_LOCATION", "us-central1")
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", "./.llm_cache.sqlite"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "50000"))
+STUB_LLM_LATENCY = float(os.getenv("STUB_LLM_LATENCY", "0"))
+
+CHAT_MODEL = "chat-bison"
+TEXT_MODEL = "text-bison"
+SELF_ASK_SUFFIX = "Are follow up questions needed here:"
+# Generation parameters the Vertex AI streaming calls accept
+STREAM_PARAMS = ("temperature", "max_output_tokens", "top_k", "top_p")
+
+
+def prompt_key(backend: str, model: str, params: Mapping[str, Any], prompt: str,
+               stop: Optional[List[str]]) -> str:
+    """Hash of everything that determines a completion."""
+    payload = json.dumps([backend, model, dict(params), prompt, stop], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def text_chunks(text: str) -> List[str]:
+    """Split text into word-sized tokens that join back into it."""
+    return re.findall(r"\s*\S+\s*?(?=\s|$)|\s+$", text) or [text]
+
+
+def stream_until_stop(chunks: Iterable[str], stop: Optional[List[str]]) -> Iterator[str]:
+    """Pass chunks on, ending before the first stop sequence like a non-streaming call.
+
+    The last few characters are held back until it is clear they do not
+    begin a stop sequence.
+    """
+    if not stop:
+        yield from chunks
+        return
+    holdback = max(len(s) for s in stop) - 1
+    pending = ""
+    for chunk in chunks:
+        pending += chunk
+        found = [pending.find(s) for s in stop if s in pending]
+        if found:
+            if min(found):
+                yield pending[:min(found)]
+            return
+        if len(pending) > holdback:
+            yield pending[:len(pending) - holdback]
+            pending = pending[len(pending) - holdback:]
+    if pending:
+        yield pending
+
+
+class PromptCache:
+    """Persistent prompt hash -> completion cache in SQLite.
+
+    Entries older than ttl are ignored and replaced; beyond maxsize entries
+    the least recently used ones are deleted. The file is shared by every
+    worker process on the host.
+    """
+
+    def __init__(self, path: Path = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 maxsize: int = LLM_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, completion TEXT NOT NULL, "
+                "created REAL NOT NULL, used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS completions_used ON completions (used)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT completion FROM completions WHERE key = ? AND created > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE completions SET used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, completion: str) -> None:
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, completion, created, used) VALUES (?, ?, ?, ?)",
+                (key, completion, now, now)
+            )
+            self._db.execute(
+                "DELETE FROM completions WHERE created <= ? OR key IN ("
+                "SELECT key FROM completions ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                (now - self.ttl, self.maxsize)
+            )
+
+
+class StubProvider:
+    """Deterministic offline completions for tests and load tests.
+
+    The answer depends only on the model and prompt; STUB_LLM_LATENCY adds a
+    fixed delay per call to model a real round trip. Self-ask prompts get a
+    final answer straight away so the market agent's output parser accepts it.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency: float = STUB_LLM_LATENCY):
+        self.latency = latency
+
+    def _answer(self, model: str, prompt: str) -> str:
+        answer = f"Stub {model} answer {hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]}."
+        if prompt.rstrip().endswith(SELF_ASK_SUFFIX):
+            return f" No.\nSo the final answer is: {answer}"
+        return answer
+
+    def complete(self, model: str, params: Mapping[str, Any], prompt: str, stop: Optional[List[str]]) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._answer(model, prompt)
+
+    def stream(self, model: str, params: Mapping[str, Any], prompt: str,
+               stop: Optional[List[str]]) -> Iterator[str]:
+        """The same answer word by word, the latency spread evenly over the words."""
+        chunks = text_chunks(self._answer(model, prompt))
+        for chunk in chunks:
+            if self.latency:
+                time.sleep(self.latency / len(chunks))
+            yield chunk
+
+
+class VertexAIProvider:
+    """Completions from Vertex AI through langchain, one client per model and parameters."""
+
+    name = "vertexai"
+
+    def __init__(self, project: str = VERTEX_PROJECT, location: str = VERTEX_LOCATION):
+        self.project = project
+        self.location = location
+        self._models: Dict[Tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def _model(self, model: str, params: Mapping[str, Any]):
+        key = (model, tuple(sorted(params.items())))
+        with self._lock:
+            if key not in self._models:
+                if model.startswith("chat-"):
+                    from langchain.chat_models import ChatVertexAI
+                    self._models[key] = ChatVertexAI(
+                        model_name=model, project=self.project, location=self.location, **params
+                    )
+                else:
+                    from langchain.llms import VertexAI
+                    self._models[key] = VertexAI(
+                        model_name=model, project=self.project, location=self.location, **params
+                    )
+            return self._models[key]
+
+    def _streaming_model(self, model: str):
+        key = ("streaming", model)
+        with self._lock:
+            if key not in self._models:
+                import vertexai
+                from vertexai.preview.language_models import ChatModel, TextGenerationModel
+                vertexai.init(project=self.project, location=self.location)
+                model_class = ChatModel if model.startswith("chat-") else TextGenerationModel
+                self._models[key] = model_class.from_pretrained(model)
+            return self._models[key]
+
+    def complete(self, model: str, params: Mapping[str, Any], prompt: str, stop: Optional[List[str]]) -> str:
+        return self._model(model, params).predict(prompt, stop=stop)
+
+    def stream(self, model: str, params: Mapping[str, Any], prompt: str,
+               stop: Optional[List[str]]) -> Iterator[str]:
+        """Completion chunks as Vertex AI generates them; stop sequences are applied by the caller."""
+        client = self._streaming_model(model)
+        options = {name: value for name, value in params.items() if name in STREAM_PARAMS}
+        if model.startswith("chat-"):
+            responses = client.start_chat().send_message_streaming(prompt, **options)
+        else:
+            responses = client.predict_streaming(prompt, **options)
+        for response in responses:
+            yield response.text
+
+
+class GatewayLLM(LLM):
+    """langchain LLM that answers from the prompt cache before calling the provider.
+
+    With streaming set, callbacks get each token through on_llm_new_token:
+    as the provider generates them on a miss, and as word-sized chunks of
+    the cached completion on a hit.
+    """
+
+    provider: Any
+    cache: Optional[PromptCache] = None
+    model: str = TEXT_MODEL
+    params: Dict[str, Any] = {}
+    streaming: bool = False
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return f"gateway-{self.provider.name}"
+
+    @property
+    def _identifying_params(self) -> Mapping[str, Any]:
+        return {"provider": self.provider.name, "model": self.model, **self.params}
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> str:
+        key = prompt_key(self.provider.name, self.model, self.params, prompt, stop)
+        if self.cache is not None:
+            completion = self.cache.get(key)
+            if completion is not None:
+                if self.streaming and run_manager is not None:
+                    for chunk in text_chunks(completion):
+                        run_manager.on_llm_new_token(chunk)
+                return completion
+        if self.streaming:
+            chunks = []
+            stream = limiters.stream(self.provider.name, self.provider.stream, self.model, self.params, prompt, stop)
+            for chunk in stream_until_stop(stream, stop):
+                chunks.append(chunk)
+                if run_manager is not None:
+                    run_manager.on_llm_new_token(chunk)
+            completion = "".join(chunks)
+        else:
+            completion = limiters.call(
+                self.provider.name, self.provider.complete, self.model, self.params, prompt, stop
+            )
+        # Roughly four characters per token
+        credit_ledger.record(self.provider.name, (len(prompt) + len(completion)) / 4)
+        if self.cache is not None:
+            self.cache.set(key, completion)
+        return completion
+
+
+class TokenQueueHandler(BaseCallbackHandler):
+    """Forward LLM tokens from the worker thread to an asyncio queue."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        self.loop = loop
+        self.queue = queue
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, token)
+
+
+class LLMGateway:
+    """The one place agents get language models from."""
+
+    def __init__(self, provider, cache: Optional[PromptCache] = None):
+        self.provider = provider
+        self.cache = cache
+
+    def llm(self, model: str = TEXT_MODEL, streaming: bool = False, **params: Any) -> GatewayLLM:
+        return GatewayLLM(provider=self.provider, cache=self.cache, model=model, params=params, streaming=streaming)
+
+    def chat_llm(self, streaming: bool = False, **params: Any) -> GatewayLLM:
+        return self.llm(CHAT_MODEL, streaming, **params)
+
+
+def create_provider():
+    if LLM_BACKEND == "stub":
+        return StubProvider()
+    return VertexAIProvider()
+
+
+gateway = LLMGateway(create_provider(), PromptCache())
@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from fastapi import APIRouter, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Gauge, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+from starlette.routing import Match
+
+from db import get_db
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Set PROMETHEUS_MULTIPROC_DIR when running several uvicorn workers, so one
+# scrape reports all of them
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# Pipeline stages run from seconds (Mongo writes) to many minutes (clones, LLM rounds)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+STAGE_SECONDS = Histogram(
+    "jurynova_stage_seconds", "Duration of a pipeline stage", ["pipeline", "stage", "status"],
+    buckets=STAGE_BUCKETS
+)
+STAGE_IN_FLIGHT = Gauge(
+    "jurynova_stage_in_flight", "Pipeline stages currently running", ["pipeline", "stage"],
+    multiprocess_mode="livesum"
+)
+REQUEST_SECONDS = Histogram(
+    "jurynova_http_request_seconds", "Time to the response headers of an API request",
+    ["method", "route", "status"]
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "jurynova_http_requests_in_flight", "API requests currently being handled", ["method", "route"],
+    multiprocess_mode="livesum"
+)
+
+
+@contextmanager
+def span(pipeline: str, stage: str, **fields: Any) -> Iterator[Dict[str, Any]]:
+    """Time a stage, logging it as one structured line and recording it in the histograms.
+
+    Works in coroutines and worker threads alike. The yielded dict can be
+    updated with fields that are only known once the stage has run.
+    """
+    STAGE_IN_FLIGHT.labels(pipeline, stage).inc()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield fields
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_IN_FLIGHT.labels(pipeline, stage).dec()
+        STAGE_SECONDS.labels(pipeline, stage, status).observe(duration)
+        logger.info(json.dumps({
+            "span": f"{pipeline}.{stage}",
+            "status": status,
+            "duration_ms": round(duration * 1000, 1),
+            **fields,
+        }, default=str))
+
+
+def route_template(request: Request) -> str:
+    """The matched route's path template, keeping ids out of metric labels."""
+    for route in request.app.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+async def track_requests(request: Request, call_next):
+    """HTTP middleware recording latency and in-flight requests per route."""
+    route = route_template(request)
+    REQUESTS_IN_FLIGHT.labels(request.method, route).inc()
+    start = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.labels(request.method, route).dec()
+        REQUEST_SECONDS.labels(request.method, route, status).observe(time.perf_counter() - start)
+
+
+async def queue_depths() -> bytes:
+    """Queued and running jobs per type, read from Mongo at scrape time."""
+    registry = CollectorRegistry()
+    depth = Gauge("jurynova_job_queue_depth", "Background jobs by type and status", ["type", "status"],
+                  registry=registry)
+    async for group in get_db().jobs.aggregate([
+        {"$match": {"status": {"$in": ["queued", "running"]}}},
+        {"$group": {"_id": {"type": "$type", "status": "$status"}, "count": {"$sum": 1}}},
+    ]):
+        depth.labels(group["_id"]["type"], group["_id"]["status"]).set(group["count"])
+    return generate_latest(registry)
+
+
+@router.get("/metrics")
+async def get_metrics() -> Response:
+    """Prometheus metrics for requests, pipeline stages and job queues."""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    body = generate_latest(registry)
+    try:
+        body += await queue_depths()
+    except Exception as e:
+        logger.error(f"Error reading job queue depths: {e}")
+    return Response(content=body, media_type=CONTENT_TYPE_LATEST)
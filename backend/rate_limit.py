@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+from fastapi import APIRouter
+from pymongo import UpdateOne
+
+from db import get_db
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Configuration
+# Per provider: requests per second, burst size, concurrent calls.
+# Override with RATE_LIMIT_<PROVIDER>="rate,burst,concurrency". Limits are for
+# the whole server; each of the WEB_CONCURRENCY worker processes gets an equal share.
+DEFAULT_LIMITS: Dict[str, Tuple[float, int, int]] = {
+    "vertexai": (5.0, 10, 8),     # 300 requests per minute
+    "cohere": (1.6, 2, 2),        # 100 embed calls per minute
+    "duckduckgo": (1.0, 2, 2),
+    "elevenlabs": (2.0, 2, 2),
+}
+WORKER_COUNT = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+THROTTLE_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# After a throttle the rate is halved, then regained a little with each success
+MIN_RATE_FRACTION = 0.1
+RATE_RECOVERY = 0.02
+
+# Budgets are in each provider's billing unit: LLM tokens, Cohere texts,
+# search calls and TTS characters. Unset means unlimited.
+BUDGET_UNITS = {"vertexai": "tokens", "cohere": "texts", "duckduckgo": "calls", "elevenlabs": "characters"}
+BACKGROUND_RESERVE = float(os.getenv("CREDIT_BACKGROUND_RESERVE", "0.1"))
+LEDGER_SYNC_INTERVAL = float(os.getenv("CREDIT_SYNC_INTERVAL", "10"))
+
+
+def is_throttled(error: Exception) -> bool:
+    """Whether an exception is a provider's "too many requests" response."""
+    for attribute in ("http_status", "status_code", "code", "status"):
+        if getattr(error, attribute, None) == 429:
+            return True
+    if type(error).__name__ in ("ResourceExhausted", "TooManyRequests", "RateLimitError"):
+        return True
+    message = str(error).lower()
+    return "429" in message or "rate limit" in message or "resource_exhausted" in message or "quota" in message
+
+
+class TokenBucket:
+    """Blocking token bucket; the rate can be changed while in use."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ProviderLimiter:
+    """Rate and concurrency limit for one provider, adapting to throttling.
+
+    Calls take a concurrency slot and a bucket token. A throttled call halves
+    the request rate and is retried with exponential backoff; each success
+    recovers a little of the configured rate, so throughput settles just
+    under what the provider actually accepts.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, concurrency: int):
+        self.name = name
+        self.max_rate = rate
+        self.bucket = TokenBucket(rate, burst)
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.calls = 0
+        self.throttled = 0
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        with self.slots:
+            self.bucket.acquire()
+            yield
+
+    def _on_success(self) -> None:
+        self.calls += 1
+        self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate * RATE_RECOVERY)
+
+    def _on_throttle(self) -> None:
+        self.throttled += 1
+        self.bucket.rate = max(self.max_rate * MIN_RATE_FRACTION, self.bucket.rate / 2)
+        logger.warning(f"{self.name} throttled; request rate lowered to {self.bucket.rate:.2f}/s")
+
+    @staticmethod
+    def _backoff(attempt: int) -> None:
+        time.sleep(min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0))
+
+    def call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        for attempt in range(1, THROTTLE_RETRIES + 1):
+            with self.slot():
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    if not is_throttled(e) or attempt == THROTTLE_RETRIES:
+                        raise
+                    self._on_throttle()
+                else:
+                    self._on_success()
+                    return result
+            self._backoff(attempt)
+
+    def stream(self, fn: Callable[..., Iterable[Any]], *args: Any, **kwargs: Any) -> Iterator[Any]:
+        """Like call, for a function returning an iterable; the slot is held until it is exhausted.
+
+        A throttled call is only retried before its first item, since what
+        was already passed on cannot be taken back.
+        """
+        for attempt in range(1, THROTTLE_RETRIES + 1):
+            started = False
+            with self.slot():
+                try:
+                    for item in fn(*args, **kwargs):
+                        started = True
+                        yield item
+                except Exception as e:
+                    if started or not is_throttled(e) or attempt == THROTTLE_RETRIES:
+                        raise
+                    self._on_throttle()
+                else:
+                    self._on_success()
+                    return
+            self._backoff(attempt)
+
+
+class Limiters:
+    """Registry of provider limiters; providers without a configured limit are not limited."""
+
+    def __init__(self):
+        self._limiters: Dict[str, Optional[ProviderLimiter]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str) -> Optional[ProviderLimiter]:
+        with self._lock:
+            if provider not in self._limiters:
+                self._limiters[provider] = self._create(provider)
+            return self._limiters[provider]
+
+    def _create(self, provider: str) -> Optional[ProviderLimiter]:
+        setting = os.getenv(f"RATE_LIMIT_{provider.upper()}")
+        if setting:
+            rate, burst, concurrency = setting.split(",")
+            limits = (float(rate), int(burst), int(concurrency))
+        elif provider in DEFAULT_LIMITS:
+            limits = DEFAULT_LIMITS[provider]
+        else:
+            return None
+        rate, burst, concurrency = limits
+        return ProviderLimiter(
+            provider, rate / WORKER_COUNT, max(1, burst // WORKER_COUNT), max(1, concurrency // WORKER_COUNT)
+        )
+
+    def call(self, provider: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        limiter = self.get(provider)
+        if limiter is None:
+            return fn(*args, **kwargs)
+        return limiter.call(fn, *args, **kwargs)
+
+    def stream(self, provider: str, fn: Callable[..., Iterable[Any]], *args: Any, **kwargs: Any) -> Iterator[Any]:
+        limiter = self.get(provider)
+        if limiter is None:
+            return iter(fn(*args, **kwargs))
+        return limiter.stream(fn, *args, **kwargs)
+
+    @contextmanager
+    def slot(self, provider: str) -> Iterator[None]:
+        limiter = self.get(provider)
+        if limiter is None:
+            yield
+        else:
+            with limiter.slot():
+                yield
+
+
+class CreditLedger:
+    """Running usage per provider, kept in the ``credits`` collection.
+
+    Usage is recorded in memory from the worker threads that make provider
+    calls and folded into Mongo every LEDGER_SYNC_INTERVAL seconds, which also
+    picks up what other workers spent. Budgets come from CREDIT_BUDGET_<PROVIDER>
+    or, taking precedence, a ``budget`` field on the provider's ledger document.
+    """
+
+    def __init__(self):
+        self.used: Dict[str, float] = {}
+        self.budgets: Dict[str, float] = {
+            provider: float(os.environ[f"CREDIT_BUDGET_{provider.upper()}"])
+            for provider in BUDGET_UNITS
+            if os.getenv(f"CREDIT_BUDGET_{provider.upper()}")
+        }
+        self._pending: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, provider: str, units: float) -> None:
+        with self._lock:
+            self._pending[provider] = self._pending.get(provider, 0) + units
+            self.used[provider] = self.used.get(provider, 0) + units
+
+    def exhausted(self, provider: str, reserve: float = 0.0) -> bool:
+        """Whether usage has reached the budget, less a reserved fraction of it."""
+        budget = self.budgets.get(provider)
+        return budget is not None and self.used.get(provider, 0) >= budget * (1 - reserve)
+
+    def allows_background(self) -> bool:
+        """Background jobs stop before any budget runs out, leaving the reserve to interactive use."""
+        return not any(self.exhausted(provider, BACKGROUND_RESERVE) for provider in self.budgets)
+
+    async def sync(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        credits = get_db().credits
+        if pending:
+            try:
+                await credits.bulk_write([
+                    UpdateOne({"_id": provider}, {"$inc": {"used": units}}, upsert=True)
+                    for provider, units in pending.items()
+                ])
+            except Exception:
+                # Keep the usage for the next sync
+                with self._lock:
+                    for provider, units in pending.items():
+                        self._pending[provider] = self._pending.get(provider, 0) + units
+                raise
+        async for ledger in credits.find({}):
+            with self._lock:
+                self.used[ledger["_id"]] = ledger.get("used", 0) + self._pending.get(ledger["_id"], 0)
+            if ledger.get("budget") is not None:
+                self.budgets[ledger["_id"]] = float(ledger["budget"])
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Error syncing credit ledger: {e}")
+            await asyncio.sleep(LEDGER_SYNC_INTERVAL)
+
+    async def start(self) -> None:
+        await self.sync()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.sync()
+
+
+limiters = Limiters()
+credit_ledger = CreditLedger()
+
+
+@router.get("/credits")
+async def get_credits() -> Dict[str, Any]:
+    """Return usage, budget and throttling per provider."""
+    providers = {}
+    for provider in sorted(set(BUDGET_UNITS) | set(credit_ledger.used)):
+        limiter = limiters.get(provider)
+        providers[provider] = {
+            "unit": BUDGET_UNITS.get(provider),
+            "used": credit_ledger.used.get(provider, 0),
+            "budget": credit_ledger.budgets.get(provider),
+            "rate": limiter.bucket.rate if limiter else None,
+            "throttled": limiter.throttled if limiter else 0,
+        }
+    return {"message": "successful", "providers": providers}
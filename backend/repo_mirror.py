@@ -0,0 +1,176 @@
+import fnmatch
+import logging
+import os
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from git import BadName, Repo
+from langchain.docstore.document import Document
+from langchain.document_loaders.base import BaseLoader
+
+logger = logging.getLogger(__name__)
+
+HEAD_REF = "refs/jurynova/head"
+ANALYZED_REF = "refs/jurynova/analyzed"
+BINARY_SNIFF_BYTES = 8000
+
+
+def _env_list(name: str, default: str) -> List[str]:
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
+
+
+# Ingestion limits and filters
+CLONE_DEPTH = int(os.getenv("INGEST_CLONE_DEPTH", "1"))
+MAX_FILE_BYTES = int(os.getenv("INGEST_MAX_FILE_BYTES", str(200 * 1024)))
+MAX_REPO_BYTES = int(os.getenv("INGEST_MAX_REPO_BYTES", str(20 * 1024 * 1024)))
+INCLUDE_GLOBS = _env_list("INGEST_INCLUDE", "*")
+EXCLUDE_GLOBS = _env_list(
+    "INGEST_EXCLUDE",
+    "node_modules/*,vendor/*,bower_components/*,dist/*,build/*,out/*,target/*,.next/*,"
+    "__pycache__/*,venv/*,.venv/*,env/*,.git/*,.idea/*,.vscode/*,"
+    "package-lock.json,yarn.lock,pnpm-lock.yaml,poetry.lock,Pipfile.lock,Cargo.lock,"
+    "composer.lock,Gemfile.lock,go.sum,*.min.js,*.min.css,*.map"
+)
+
+LANGUAGES: Dict[str, str] = {
+    ".py": "Python", ".ipynb": "Jupyter Notebook", ".js": "JavaScript", ".jsx": "JavaScript",
+    ".mjs": "JavaScript", ".cjs": "JavaScript", ".ts": "TypeScript", ".tsx": "TypeScript",
+    ".svelte": "Svelte", ".vue": "Vue", ".html": "HTML", ".css": "CSS", ".scss": "SCSS",
+    ".java": "Java", ".kt": "Kotlin", ".swift": "Swift", ".go": "Go", ".rs": "Rust",
+    ".c": "C", ".h": "C", ".cpp": "C++", ".cc": "C++", ".hpp": "C++", ".cs": "C#",
+    ".rb": "Ruby", ".php": "PHP", ".dart": "Dart", ".scala": "Scala", ".sol": "Solidity",
+    ".r": "R", ".sql": "SQL", ".sh": "Shell", ".ps1": "PowerShell",
+    ".md": "Markdown", ".rst": "reStructuredText", ".txt": "Text",
+    ".json": "JSON", ".yaml": "YAML", ".yml": "YAML", ".toml": "TOML", ".xml": "XML",
+    ".gradle": "Gradle", ".cfg": "INI", ".ini": "INI",
+}
+LANGUAGE_FILENAMES: Dict[str, str] = {
+    "Dockerfile": "Dockerfile", "Makefile": "Makefile", "Procfile": "Procfile",
+    "requirements.txt": "Text", "Gemfile": "Ruby",
+}
+
+
+def detect_language(path: str) -> Optional[str]:
+    """Language of a file from its name, or None for files we do not index."""
+    name = PurePosixPath(path).name
+    if name in LANGUAGE_FILENAMES:
+        return LANGUAGE_FILENAMES[name]
+    return LANGUAGES.get(PurePosixPath(path).suffix.lower())
+
+
+def _matches(path: str, pattern: str) -> bool:
+    """Match a glob against the file name, or a directory glob at any depth."""
+    if pattern.endswith("/*"):
+        return pattern[:-2] in PurePosixPath(path).parts[:-1]
+    return fnmatch.fnmatch(PurePosixPath(path).name, pattern) or fnmatch.fnmatch(path, pattern)
+
+
+def is_ingested(path: str) -> bool:
+    """Whether a repository path passes the include/exclude globs and has a known language."""
+    if not any(_matches(path, pattern) for pattern in INCLUDE_GLOBS):
+        return False
+    if any(_matches(path, pattern) for pattern in EXCLUDE_GLOBS):
+        return False
+    return detect_language(path) is not None
+
+
+class RepoMirror:
+    """Bare, shallow local mirror of a submission's repository.
+
+    The mirror is cloned once at depth CLONE_DEPTH and then only fetched, so
+    re-analysis costs the objects pushed since the last run. Files are read
+    straight from commit trees; no working copy is ever checked out.
+    """
+
+    def __init__(self, repo_link: str, path: Path):
+        self.repo_link = repo_link
+        self.path = path
+        self.repo: Optional[Repo] = None
+
+    def sync(self) -> str:
+        """Clone or fetch the mirror and return the remote HEAD commit SHA."""
+        if (self.path / "HEAD").exists():
+            self.repo = Repo(self.path)
+            self.repo.git.fetch(self.repo_link, f"+HEAD:{HEAD_REF}", depth=CLONE_DEPTH)
+        else:
+            self.repo = Repo.clone_from(self.repo_link, self.path, bare=True, depth=CLONE_DEPTH)
+            self.repo.git.update_ref(HEAD_REF, "HEAD")
+        return self.repo.commit(HEAD_REF).hexsha
+
+    def mark_analyzed(self, sha: str) -> None:
+        """Keep the analyzed commit reachable so later diffs can still read it."""
+        self.repo.git.update_ref(ANALYZED_REF, sha)
+
+    def has_commit(self, sha: str) -> bool:
+        try:
+            self.repo.commit(sha)
+            return True
+        except (BadName, ValueError):
+            return False
+
+    def changed_files(self, old_sha: str, new_sha: str) -> Tuple[Set[str], Set[str]]:
+        """Paths changed between two commits.
+
+        Returns:
+            Tuple[Set[str], Set[str]] - paths present at new_sha whose content
+            changed, and paths whose old content is gone (deleted or renamed)
+        """
+        changed, removed = set(), set()
+        for diff in self.repo.commit(old_sha).diff(new_sha):
+            if diff.a_path and (diff.deleted_file or diff.renamed_file):
+                removed.add(diff.a_path)
+            if diff.b_path and not diff.deleted_file:
+                changed.add(diff.b_path)
+        return changed, removed
+
+
+class MirrorLoader(BaseLoader):
+    """Stream the ingestible text files of a mirror commit.
+
+    Files are filtered by path and language before their content is read,
+    files over MAX_FILE_BYTES are skipped, and loading stops once
+    MAX_REPO_BYTES of content has been yielded.
+    """
+
+    def __init__(self, repo: Repo, sha: str, paths: Optional[Set[str]] = None):
+        self.repo = repo
+        self.sha = sha
+        self.paths = paths
+        self.languages: Dict[str, int] = {}
+
+    def lazy_load(self) -> Iterator[Document]:
+        total = 0
+        for item in self.repo.commit(self.sha).tree.traverse():
+            if item.type != "blob":
+                continue  # Trees and submodule commits
+            if self.paths is not None and item.path not in self.paths:
+                continue
+            if not is_ingested(item.path) or item.size > MAX_FILE_BYTES:
+                continue
+            if total + item.size > MAX_REPO_BYTES:
+                logger.warning(f"Repository byte cap reached at {item.path}; skipping remaining files")
+                return
+
+            data = item.data_stream.read()
+            if b"\0" in data[:BINARY_SNIFF_BYTES]:
+                continue
+            try:
+                text = data.decode("utf-8")
+            except UnicodeDecodeError:
+                continue
+
+            total += item.size
+            language = detect_language(item.path)
+            self.languages[language] = self.languages.get(language, 0) + item.size
+            # Same metadata as langchain's GitLoader, plus the detected language
+            metadata = {
+                "source": item.path,
+                "file_path": item.path,
+                "file_name": item.name,
+                "file_type": Path(item.name).suffix,
+                "language": language,
+            }
+            yield Document(page_content=text, metadata=metadata)
+
+    def load(self) -> List[Document]:
+        return list(self.lazy_load())
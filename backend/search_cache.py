@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+from cachetools import TTLCache
+
+from rate_limit import credit_ledger, limiters
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "duckduckgo")  # or "file:<path to JSON>"
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(24 * 3600)))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "4096"))
+FILE_SEARCH_LATENCY = float(os.getenv("FILE_SEARCH_LATENCY", "0"))
+NO_RESULT = "No good DuckDuckGo Search Result was found"
+
+
+def normalize_query(query: str) -> str:
+    """Cache key for a query: case, punctuation and spacing do not matter."""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+
+class FileSearchBackend:
+    """Offline stand-in for web search, answering from a JSON file.
+
+    The file maps normalized queries to result text. Unknown queries get the
+    same answer DuckDuckGo gives for no results; FILE_SEARCH_LATENCY adds a
+    fixed delay per call so benchmarks can model a real search round trip.
+    """
+
+    def __init__(self, path: Path, latency: float = FILE_SEARCH_LATENCY):
+        self.latency = latency
+        results = json.loads(path.read_text()) if path.exists() else {}
+        self.results: Dict[str, str] = {normalize_query(q): r for q, r in results.items()}
+
+    def run(self, query: str) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return self.results.get(normalize_query(query), NO_RESULT)
+
+
+class CachedSearch:
+    """Search shared by all market analyses, with a TTL + LRU result cache.
+
+    Concurrent misses for the same normalized query wait for a single
+    backend call instead of all hitting the search provider.
+    """
+
+    def __init__(self, backend: Callable[[str], str], ttl: float = SEARCH_CACHE_TTL,
+                 maxsize: int = SEARCH_CACHE_SIZE):
+        self.backend = backend
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Lock] = {}
+
+    def run(self, query: str) -> str:
+        key = normalize_query(query)
+        with self._lock:
+            if key in self.cache:
+                self.hits += 1
+                return self.cache[key]
+            key_lock = self._inflight.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if key in self.cache:
+                    self.hits += 1
+                    return self.cache[key]
+                self.misses += 1
+            try:
+                result = self.backend(query)
+                with self._lock:
+                    self.cache[key] = result
+            finally:
+                # Failed queries must not leave their lock behind
+                with self._lock:
+                    self._inflight.pop(key, None)
+            return result
+
+
+def create_search_backend() -> Callable[[str], str]:
+    if SEARCH_BACKEND.startswith("file:"):
+        return FileSearchBackend(Path(SEARCH_BACKEND[len("file:"):])).run
+    duckduckgo = None
+
+    def run(query: str) -> str:
+        nonlocal duckduckgo
+        if duckduckgo is None:
+            # langchain is imported on the first search, not at server start
+            from langchain.tools import DuckDuckGoSearchRun
+            duckduckgo = DuckDuckGoSearchRun()
+        result = limiters.call("duckduckgo", duckduckgo.run, query)
+        credit_ledger.record("duckduckgo", 1)
+        return result
+
+    return run
+
+
+search = CachedSearch(create_search_backend())
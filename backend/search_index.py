@@ -0,0 +1,337 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from db import find_project, find_projects, get_db
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from rate_limit import credit_ledger, limiters
+
+# cohere and annoy are imported on first use, not at server start
+if TYPE_CHECKING:
+    from annoy import AnnoyIndex
+
+# Load environment variables
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "default")  # or "stub"
+EMBED_MODEL = os.getenv("COHERE_EMBED_MODEL", "large")
+EMBED_BATCH_SIZE = 96  # Cohere's per-request text limit
+INDEX_DIR = Path(os.getenv("SEARCH_INDEX_DIR", "./search_index"))
+INDEX_TREES = 10
+REBUILD_DELAY = float(os.getenv("SEARCH_REBUILD_DELAY", "30"))
+REBUILD_THRESHOLD = int(os.getenv("SEARCH_REBUILD_THRESHOLD", "50"))
+REBUILD_LOCK_TTL = 600
+GENERATIONS_KEPT = 2
+
+# Project fields used by the search and similarity indexes that API responses should not carry
+INDEX_FIELDS = {
+    "embedding": 0, "embeddingHash": 0, "embeddedAt": 0, "searchIndexed": 0,
+    "codeSignature": 0, "codeBands": 0, "codeSignatureCommit": 0,
+}
+
+_cohere_client = None
+
+
+def get_cohere_client():
+    global _cohere_client
+    if _cohere_client is None:
+        import cohere
+        _cohere_client = cohere.Client(os.getenv("COHERE_API_KEY"))
+    return _cohere_client
+
+
+def project_document(project: Dict[str, Any]) -> str:
+    """Text that represents a project in the search index."""
+    return f"Project Description: {project['longDescription']} Hackathon Theme: {project['theme']}"
+
+
+def document_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embed texts with Cohere, batching to stay within the request limit."""
+    if EMBED_BACKEND == "stub":
+        from vector_store import StubEmbeddings
+        return StubEmbeddings().embed_documents(texts)
+    embeddings = []
+    for start in range(0, len(texts), EMBED_BATCH_SIZE):
+        batch = texts[start:start + EMBED_BATCH_SIZE]
+        embeddings.extend(limiters.call(
+            "cohere",
+            get_cohere_client().embed,
+            texts=batch,
+            model=EMBED_MODEL,
+            truncate="RIGHT"
+        ).embeddings)
+        credit_ledger.record("cohere", len(batch))
+    return embeddings
+
+
+def angular_distances(vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """Annoy's angular distance, sqrt(2 * (1 - cos)), for a block of vectors."""
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    cosine = vectors @ query / np.where(norms == 0, 1, norms)
+    return np.sqrt(np.clip(2 * (1 - cosine), 0, None))
+
+
+class ProjectSearchIndex:
+    """Annoy index over stored project embeddings, shared on disk by all workers.
+
+    Embeddings live on the project documents. Each rebuild writes a new,
+    immutable generation of the Annoy file and then atomically repoints
+    ``CURRENT`` at it; every worker memory-maps the current generation and
+    swaps to a newer one on its next query. Projects embedded since the last
+    rebuild are flagged ``searchIndexed: False`` and scanned exactly until
+    the next background rebuild folds them in.
+    """
+
+    def __init__(self, index_dir: Path = INDEX_DIR):
+        self.index_dir = index_dir
+        self.generation: Optional[str] = None
+        self.index: Optional["AnnoyIndex"] = None
+        self.ids: List[str] = []
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._rebuild_task: Optional[asyncio.Task] = None
+
+    @property
+    def current_path(self) -> Path:
+        return self.index_dir / "CURRENT"
+
+    def _generation_paths(self, generation: str) -> Tuple[Path, Path]:
+        return (
+            self.index_dir / f"projects-{generation}.ann",
+            self.index_dir / f"projects-{generation}.json",
+        )
+
+    def refresh(self) -> None:
+        """Map the current generation if another worker published a new one."""
+        try:
+            generation = self.current_path.read_text().strip()
+        except FileNotFoundError:
+            return
+        if generation == self.generation:
+            return
+
+        from annoy import AnnoyIndex
+        index_path, ids_path = self._generation_paths(generation)
+        meta = json.loads(ids_path.read_text())
+        index = AnnoyIndex(meta["dimension"], "angular")
+        index.load(str(index_path))  # mmap, shared through the page cache
+        # Queries in flight keep their reference to the previous generation
+        self.index, self.ids, self.generation = index, meta["ids"], generation
+
+    def _publish(self, index: "AnnoyIndex", dimension: int, ids: List[str]) -> str:
+        """Write a new immutable generation and atomically make it current."""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        generation = str(time.time_ns())
+        index_path, ids_path = self._generation_paths(generation)
+        index.save(str(index_path))
+        index.unload()
+        ids_path.write_text(json.dumps({"dimension": dimension, "ids": ids}))
+
+        tmp_current = self.current_path.with_suffix(".tmp")
+        with open(tmp_current, "w") as f:
+            f.write(generation)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_current, self.current_path)
+        self._prune_generations()
+        return generation
+
+    def _prune_generations(self) -> None:
+        generations = sorted(
+            (p.name[len("projects-"):-len(".ann")] for p in self.index_dir.glob("projects-*.ann")),
+            key=int
+        )
+        for generation in generations[:-GENERATIONS_KEPT]:
+            for path in self._generation_paths(generation):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass  # Still mapped by a worker on a platform that forbids it
+
+    async def _acquire_lock(self) -> bool:
+        """Take the cross-worker rebuild lease stored in Mongo."""
+        now = datetime.utcnow()
+        try:
+            await get_db().locks.update_one(
+                {"_id": "search_index", "$or": [{"expiresAt": {"$lt": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "expiresAt": now + timedelta(seconds=REBUILD_LOCK_TTL)}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def _release_lock(self) -> None:
+        await get_db().locks.delete_one({"_id": "search_index", "owner": self.owner})
+
+    async def embed_project(self, project: Dict[str, Any]) -> bool:
+        """Store the project's embedding if its indexed text changed.
+
+        Returns:
+            bool - True if a new embedding was computed
+        """
+        text = project_document(project)
+        text_hash = document_hash(text)
+        if project.get("embeddingHash") == text_hash:
+            return False
+
+        loop = asyncio.get_running_loop()
+        embedding = (await loop.run_in_executor(None, embed_texts, [text]))[0]
+        await get_db().projects.update_one(
+            {"_id": ObjectId(project["_id"])},
+            {"$set": {"embedding": embedding, "embeddingHash": text_hash, "embeddedAt": datetime.utcnow(),
+                      "searchIndexed": False}}
+        )
+        return True
+
+    async def embed_projects(self, projects: List[Dict[str, Any]]) -> None:
+        """Embed many projects with batched embedding calls and one bulk write."""
+        if not projects:
+            return
+        texts = [project_document(p) for p in projects]
+        loop = asyncio.get_running_loop()
+        embeddings = await loop.run_in_executor(None, embed_texts, texts)
+        now = datetime.utcnow()
+        await get_db().projects.bulk_write([
+            UpdateOne(
+                {"_id": p["_id"]},
+                {"$set": {"embedding": e, "embeddingHash": document_hash(t), "embeddedAt": now, "searchIndexed": False}}
+            )
+            for p, t, e in zip(projects, texts, embeddings)
+        ])
+
+    async def backfill(self) -> int:
+        """Embed projects that have no stored embedding, in batches."""
+        projects = await find_projects(
+            {"embedding": {"$exists": False}},
+            {"longDescription": 1, "theme": 1}
+        )
+        await self.embed_projects(projects)
+        return len(projects)
+
+    async def rebuild(self) -> None:
+        """Publish a new index generation from stored embeddings.
+
+        Only one worker rebuilds at a time; the others skip and pick up the
+        published generation on their next query.
+        """
+        if not await self._acquire_lock():
+            return
+        try:
+            await self._rebuild()
+        finally:
+            await self._release_lock()
+
+    def _build(self, embeddings: List[List[float]], ids: List[str]) -> str:
+        from annoy import AnnoyIndex
+        dimension = len(embeddings[0])
+        index = AnnoyIndex(dimension, "angular")
+        for i, embedding in enumerate(embeddings):
+            index.add_item(i, embedding)
+        index.build(INDEX_TREES)
+        return self._publish(index, dimension, ids)
+
+    async def _rebuild(self) -> None:
+        projects = await find_projects(
+            {"embedding": {"$exists": True}},
+            {"embedding": 1, "embeddingHash": 1}
+        )
+        if not projects:
+            return
+
+        ids = [str(p["_id"]) for p in projects]
+        loop = asyncio.get_running_loop()
+        generation = await loop.run_in_executor(None, self._build, [p["embedding"] for p in projects], ids)
+
+        # Only clear the pending flag for embeddings that made it into this build
+        await get_db().projects.bulk_write([
+            UpdateOne(
+                {"_id": p["_id"], "embeddingHash": p["embeddingHash"]},
+                {"$set": {"searchIndexed": True}}
+            )
+            for p in projects
+        ])
+        self.refresh()
+        logger.info(f"Search index generation {generation} built with {len(ids)} projects")
+
+    async def query(self, vector: List[float], k: int = 10) -> List[str]:
+        """Return ids of the k projects closest to the query vector."""
+        self.refresh()
+        index, ids = self.index, self.ids
+        candidates: Dict[str, float] = {}
+        if index is not None:
+            indices, distances = index.get_nns_by_vector(vector, k, include_distances=True)
+            for i, distance in zip(indices, distances):
+                candidates[ids[i]] = distance
+
+        pending = await find_projects({"searchIndexed": False}, {"embedding": 1})
+        if pending:
+            vectors = np.array([p["embedding"] for p in pending], dtype=np.float32)
+            distances = angular_distances(vectors, np.array(vector, dtype=np.float32))
+            for project, distance in zip(pending, distances):
+                candidates[str(project["_id"])] = float(distance)
+
+        ranked: List[Tuple[str, float]] = sorted(candidates.items(), key=lambda item: item[1])
+        return [project_id for project_id, _ in ranked[:k]]
+
+    def schedule_rebuild(self, delay: float = REBUILD_DELAY) -> None:
+        """Rebuild in the background, coalescing bursts of new projects."""
+        if self._rebuild_task and not self._rebuild_task.done():
+            return
+        self._rebuild_task = asyncio.create_task(self._rebuild_later(delay))
+
+    async def _rebuild_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            await self.rebuild()
+        except Exception as e:
+            logger.error(f"Error rebuilding search index: {e}")
+
+    async def index_project(self, project_id: str) -> None:
+        """Embed a new or changed project and queue it for the next rebuild."""
+        project = await find_project(project_id, {"longDescription": 1, "theme": 1, "embeddingHash": 1})
+        if not project:
+            return
+        if not await self.embed_project(project):
+            return
+        await self.project_added()
+
+    async def project_added(self) -> None:
+        """Schedule a rebuild, immediately once enough projects are pending."""
+        pending = await get_db().projects.count_documents({"searchIndexed": False})
+        self.schedule_rebuild(0 if pending >= REBUILD_THRESHOLD else REBUILD_DELAY)
+
+    async def warm(self) -> None:
+        """Embed any unembedded projects and build the index if it is missing or stale."""
+        try:
+            if not await self._acquire_lock():
+                return  # Another worker is already warming the shared index
+            try:
+                await self.backfill()
+                self.refresh()
+                if self.index is None or await get_db().projects.count_documents({"searchIndexed": False}):
+                    await self._rebuild()
+            finally:
+                await self._release_lock()
+        except Exception as e:
+            logger.error(f"Error warming search index: {e}")
+
+
+search_index = ProjectSearchIndex()
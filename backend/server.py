@@ -1,15 +1,75 @@
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from fastapi import FastAPI
-from pymongo import MongoClient
 import uvicorn
-from agents.marketagent import router as marketAgent_router
-from agents.codeagent import router as codeAgent_router
-from agents.chatagent import router as chatAgent_router
+import asyncio
+import logging
+import time
+from agents.marketagent import router as marketAgent_router, invoke_market_agent
+from agents.codeagent import router as codeAgent_router, invoke_code_agent
+from agents.chatagent import router as chatAgent_router, get_chat_agent
 from agents.crudagent import router as crudAgent_router
 from fastapi.middleware.cors import CORSMiddleware
+import db
+from search_index import search_index
+from similarity import description_matrix, refresh_code_bands
+from jobs import router as jobs_router, job_queue
+from rate_limit import router as credits_router, credit_ledger
+from metrics import router as metrics_router, track_requests
 import os
 load_dotenv()
-app = FastAPI()
+
+logger = logging.getLogger(__name__)
+
+# Import the agents' heavy dependencies and build their clients in the
+# background after startup, so the first request does not pay for them.
+# Turn off for quick --reload cycles.
+PREWARM = os.getenv("PREWARM", "1") == "1"
+
+
+def prewarm() -> None:
+    """Load langchain, chromadb, GitPython and the provider clients ahead of first use."""
+    start = time.perf_counter()
+    import langchain.agents  # noqa: F401 - market agent
+    import langchain.chains.question_answering  # noqa: F401 - code agent
+    import llm_gateway  # noqa: F401
+    import repo_mirror  # noqa: F401
+    import vector_store  # noqa: F401
+    get_chat_agent()
+    logger.info(f"Pre-warmed agent dependencies in {time.perf_counter() - start:.1f}s")
+
+
+async def prewarm_in_background() -> None:
+    try:
+        await asyncio.get_running_loop().run_in_executor(None, prewarm)
+    except Exception as e:
+        logger.error(f"Error pre-warming agent dependencies: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # First: everything below uses the shared pool
+    await db.connect()
+    await credit_ledger.start()
+    asyncio.create_task(search_index.warm())
+    asyncio.create_task(description_matrix.warm())
+    asyncio.create_task(refresh_code_bands())
+    if PREWARM:
+        asyncio.create_task(prewarm_in_background())
+
+    # Each agent type gets its own bounded pool (clones and LLM pipelines are heavy);
+    # both wait in the queue while provider budgets are running low
+    job_queue.register("code_agent", invoke_code_agent, concurrency=2, gate=credit_ledger.allows_background)
+    job_queue.register("market_agent", invoke_market_agent, concurrency=4, gate=credit_ledger.allows_background)
+    await job_queue.start()
+    yield
+    await job_queue.stop()
+    await credit_ledger.stop()
+    await db.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.middleware("http")(track_requests)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -21,10 +81,9 @@ app.include_router(marketAgent_router, prefix="/api", tags=["Market Agent"])
 app.include_router(codeAgent_router, prefix="/api", tags=["Code Agent"])
 app.include_router(chatAgent_router, prefix="/api", tags=["Chat Agent"])
 app.include_router(crudAgent_router, prefix="/api", tags=["CRUD Agent"])
-# MongoDB connection
-client = MongoClient("mongodb://localhost:27017/")
-db = client["mydatabase"]
-collection = db["mycollection"]
+app.include_router(jobs_router, prefix="/api", tags=["Jobs"])
+app.include_router(credits_router, prefix="/api", tags=["Credits"])
+app.include_router(metrics_router, prefix="/api", tags=["Metrics"])
 
 
 @app.get("/api")
@@ -33,4 +92,6 @@ def read_root():
 
 
 if __name__ == "__main__":
-    uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=False)
+    # Workers share the memory-mapped search index, so memory stays flat as they grow
+    uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=False,
+                workers=int(os.getenv("WEB_CONCURRENCY", "1")))
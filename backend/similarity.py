@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+
+from pymongo import UpdateOne
+
+from db import find_projects, get_db
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SHINGLE_TOKENS = 5
+NUM_PERM = 128
+# 2 rows per band: a pair with Jaccard similarity s shares a band with probability
+# 1 - (1 - s^2)^64, which is 0.998 at the default CODE_THRESHOLD of 0.3 and 0.93 at 0.2
+LSH_BANDS = 64
+ROWS_PER_BAND = NUM_PERM // LSH_BANDS
+SIGNATURE_BLOCK = 8192  # shingles hashed per NumPy block
+COSINE_BLOCK = 4096  # description vectors scored per NumPy block
+MAX_CODE_CANDIDATES = 500
+CODE_THRESHOLD = float(os.getenv("SIMILAR_CODE_THRESHOLD", "0.3"))
+DESCRIPTION_THRESHOLD = float(os.getenv("SIMILAR_DESCRIPTION_THRESHOLD", "0.85"))
+# Embeddings written by another worker just before a sync may carry a slightly earlier timestamp
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# Prose and data files say little about shared code
+NON_CODE_LANGUAGES = {
+    "Markdown", "reStructuredText", "Text", "JSON", "YAML", "TOML", "XML", "INI", "Procfile",
+}
+TOKEN = re.compile(r"[a-z_]\w*|\d+|[^\w\s]")
+COMMENT_LINE = re.compile(r"^\s*(#|//|/\*|\*|<!--|--)")
+
+# Multiply-shift hash family: h(x) = (a * x + b mod 2^64) >> 32, a odd
+_rng = np.random.default_rng(5318008)
+_A = (_rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+_SHINGLE_BASE = np.uint64(1099511628211)
+_EMPTY = np.iinfo(np.uint64).max
+
+
+def token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def shingles(text: str) -> np.ndarray:
+    """Hashes of every SHINGLE_TOKENS-token window of a source file.
+
+    Case, whitespace, layout and comment-only lines are ignored, so
+    reformatting or re-commenting copied code does not hide it.
+    """
+    code = "\n".join(line for line in text.lower().splitlines() if not COMMENT_LINE.match(line))
+    tokens = TOKEN.findall(code)
+    if len(tokens) < SHINGLE_TOKENS:
+        return np.empty(0, dtype=np.uint64)
+    hashes = np.fromiter((token_hash(token) for token in tokens), dtype=np.uint64, count=len(tokens))
+    count = len(tokens) - SHINGLE_TOKENS + 1
+    combined = np.zeros(count, dtype=np.uint64)
+    for offset in range(SHINGLE_TOKENS):
+        combined = combined * _SHINGLE_BASE + hashes[offset:offset + count]
+    return combined
+
+
+def minhash(shingle_hashes: np.ndarray) -> np.ndarray:
+    signature = np.full(NUM_PERM, _EMPTY, dtype=np.uint64)
+    for start in range(0, len(shingle_hashes), SIGNATURE_BLOCK):
+        block = shingle_hashes[start:start + SIGNATURE_BLOCK]
+        hashed = (_A[:, None] * block[None, :] + _B[:, None]) >> np.uint64(32)
+        signature = np.minimum(signature, hashed.min(axis=1))
+    return signature
+
+
+def code_signature(repo, sha: str) -> Optional[np.ndarray]:
+    """MinHash signature of the source files the code agent ingests at a commit."""
+    from repo_mirror import MirrorLoader
+    parts = [
+        shingles(document.page_content)
+        for document in MirrorLoader(repo, sha).lazy_load()
+        if document.metadata["language"] not in NON_CODE_LANGUAGES
+    ]
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return None
+    return minhash(np.unique(np.concatenate(parts)))
+
+
+def lsh_bands(signature: np.ndarray) -> List[str]:
+    return [
+        f"{band}:{hashlib.blake2b(signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes(), digest_size=8).hexdigest()}"
+        for band in range(LSH_BANDS)
+    ]
+
+
+def signature_fields(signature: Optional[np.ndarray]) -> Dict[str, Any]:
+    """Project fields for a code signature; the indexed codeBands make candidate lookup one query."""
+    if signature is None:
+        return {"codeSignature": None, "codeBands": []}
+    return {"codeSignature": [int(value) for value in signature], "codeBands": lsh_bands(signature)}
+
+
+async def similar_code(project: Dict[str, Any], threshold: float = CODE_THRESHOLD) -> List[Tuple[str, float]]:
+    """Projects whose code shares an LSH band with the project, by estimated Jaccard similarity.
+
+    Candidates sharing the most bands are compared first, since low
+    similarity pairs also share a band now and then.
+    """
+    if not project.get("codeSignature"):
+        return []
+    signature = np.array(project["codeSignature"], dtype=np.uint64)
+    bands = lsh_bands(signature)
+    candidates = await get_db().projects.aggregate([
+        {"$match": {"codeBands": {"$in": bands}, "_id": {"$ne": ObjectId(project["_id"])}}},
+        {"$project": {"codeSignature": 1, "shared": {"$size": {"$setIntersection": ["$codeBands", bands]}}}},
+        {"$sort": {"shared": -1}},
+        {"$limit": MAX_CODE_CANDIDATES},
+    ]).to_list(length=None)
+    candidates = [c for c in candidates if c.get("codeSignature")]
+    if not candidates:
+        return []
+    signatures = np.array([c["codeSignature"] for c in candidates], dtype=np.uint64)
+    scores = (signatures == signature).mean(axis=1)
+    matches = [(str(c["_id"]), float(score)) for c, score in zip(candidates, scores) if score >= threshold]
+    return sorted(matches, key=lambda match: match[1], reverse=True)
+
+
+async def refresh_code_bands() -> None:
+    """Re-band signatures stored with a different LSH_BANDS, so they stay findable."""
+    try:
+        projects = await find_projects(
+            {"codeSignature": {"$type": "array"}, f"codeBands.{LSH_BANDS - 1}": {"$exists": False}},
+            {"codeSignature": 1}
+        )
+        if projects:
+            await get_db().projects.bulk_write([
+                UpdateOne(
+                    {"_id": project["_id"]},
+                    {"$set": {"codeBands": lsh_bands(np.array(project["codeSignature"], dtype=np.uint64))}}
+                )
+                for project in projects
+            ])
+            logger.info(f"Code bands refreshed for {len(projects)} projects")
+    except Exception as e:
+        logger.error(f"Error refreshing code bands: {e}")
+
+
+class DescriptionMatrix:
+    """Normalized description embeddings of every project, kept in memory.
+
+    Each sync only reads projects embedded since the previous one, so the
+    matrix follows new and re-embedded projects without reloading.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.vectors: Optional[np.ndarray] = None
+        self.synced_at: Optional[datetime] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def sync(self) -> None:
+        if self._lock is None:
+            # Created inside the running loop, which Python 3.8 locks bind to
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            started = datetime.utcnow()
+            query: Dict[str, Any] = {"embedding": {"$exists": True}}
+            if self.synced_at is not None:
+                query["embeddedAt"] = {"$gt": self.synced_at - SYNC_OVERLAP}
+            projects = await find_projects(query, {"embedding": 1})
+            dimensions = self.vectors.shape[1] if self.vectors is not None else None
+            new_ids, new_vectors = [], []
+            for project in projects:
+                vector = np.asarray(project["embedding"], dtype=np.float32)
+                dimensions = dimensions or vector.shape[0]
+                if vector.shape[0] != dimensions:
+                    continue  # Embedded with another model
+                norm = np.linalg.norm(vector)
+                vector = vector / norm if norm else vector
+                project_id = str(project["_id"])
+                if project_id in self.rows:
+                    self.vectors[self.rows[project_id]] = vector
+                else:
+                    new_ids.append(project_id)
+                    new_vectors.append(vector)
+            if new_vectors:
+                block = np.vstack(new_vectors)
+                self.vectors = block if self.vectors is None else np.vstack([self.vectors, block])
+                for project_id in new_ids:
+                    self.rows[project_id] = len(self.ids)
+                    self.ids.append(project_id)
+            self.synced_at = started
+
+    async def warm(self) -> None:
+        """Load every stored embedding so the first lookup only reads recent changes."""
+        try:
+            await self.sync()
+            logger.info(f"Description matrix loaded with {len(self.ids)} projects")
+        except Exception as e:
+            logger.error(f"Error loading description matrix: {e}")
+
+    def _top(self, query: np.ndarray, rows: np.ndarray, k: int, threshold: float) -> List[Tuple[str, float]]:
+        """The k best of the given rows by cosine similarity to a normalized query, scored in blocks."""
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), COSINE_BLOCK):
+            scores[start:start + COSINE_BLOCK] = self.vectors[rows[start:start + COSINE_BLOCK]] @ query
+        candidates = np.flatnonzero(scores >= threshold)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        ranked = sorted(candidates, key=lambda i: scores[i], reverse=True)
+        return [(self.ids[rows[i]], float(scores[i])) for i in ranked]
+
+    def nearest(self, project_id: str, k: int, threshold: float = DESCRIPTION_THRESHOLD) -> List[Tuple[str, float]]:
+        """Projects whose description embedding has cosine similarity of at least threshold."""
+        if self.vectors is None or project_id not in self.rows:
+            return []
+        rows = np.delete(np.arange(len(self.ids)), self.rows[project_id])
+        return self._top(self.vectors[self.rows[project_id]], rows, k, threshold)
+
+    def rank(self, vector: List[float], project_ids: Iterable[str], k: int) -> List[Tuple[str, float]]:
+        """The k of the given projects closest to a query vector, by cosine similarity."""
+        rows = np.array([self.rows[i] for i in project_ids if i in self.rows], dtype=np.int64)
+        if self.vectors is None or not len(rows):
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape[0] != self.vectors.shape[1]:
+            return []
+        norm = np.linalg.norm(query)
+        return self._top(query / norm if norm else query, rows, k, -1.0)
+
+
+description_matrix = DescriptionMatrix()
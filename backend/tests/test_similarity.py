@@ -0,0 +1,27 @@
+import numpy as np
+
+from similarity import CODE_THRESHOLD, LSH_BANDS, ROWS_PER_BAND, lsh_bands, minhash
+
+PAIRS = 200
+SHARED = 300
+
+
+def pair_at(similarity: float, rng: np.random.Generator):
+    """Two shingle sets whose Jaccard similarity is the given value."""
+    unique = round(SHARED * (1 / similarity - 1) / 2)
+    values = rng.integers(0, 2 ** 63, SHARED + 2 * unique, dtype=np.uint64)
+    shared, first, second = values[:SHARED], values[SHARED:SHARED + unique], values[SHARED + unique:]
+    return np.concatenate([shared, first]), np.concatenate([shared, second])
+
+
+def test_banding_recall_at_threshold():
+    assert 1 - (1 - CODE_THRESHOLD ** ROWS_PER_BAND) ** LSH_BANDS >= 0.99
+
+
+def test_pairs_at_threshold_share_a_band():
+    rng = np.random.default_rng(0)
+    found = 0
+    for _ in range(PAIRS):
+        first, second = pair_at(CODE_THRESHOLD, rng)
+        found += bool(set(lsh_bands(minhash(first))) & set(lsh_bands(minhash(second))))
+    assert found / PAIRS >= 0.95
@@ -0,0 +1,157 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from rate_limit import credit_ledger, limiters
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+TTS_BACKEND = os.getenv("TTS_BACKEND", "elevenlabs")  # or "stub"
+TTS_CACHE_DIR = Path(os.getenv("TTS_CACHE_DIR", "./.tts_cache"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+STUB_TTS_LATENCY = float(os.getenv("STUB_TTS_LATENCY", "0"))
+CHUNK_BYTES = 64 * 1024
+
+Synthesizer = Callable[[str, str, str], Iterator[bytes]]
+
+
+def audio_key(text: str, voice: str, model: str) -> str:
+    """Content address of the speech for a text in a voice and model."""
+    return hashlib.sha256("\0".join((model, voice, text)).encode("utf-8")).hexdigest()
+
+
+def elevenlabs_synthesizer(text: str, voice: str, model: str) -> Iterator[bytes]:
+    from elevenlabs import generate, set_api_key
+    set_api_key(os.getenv("ELEVENLABS_API_KEY"))
+    yield from limiters.stream("elevenlabs", generate, text=text, voice=voice, model=model, stream=True)
+    credit_ledger.record("elevenlabs", len(text))
+
+
+class StubSynthesizer:
+    """Offline stand-in for ElevenLabs producing deterministic bytes.
+
+    Output depends only on the text, voice and model, so cache behaviour can
+    be checked without an API key; STUB_TTS_LATENCY adds a delay per chunk.
+    """
+
+    def __init__(self, latency: float = STUB_TTS_LATENCY):
+        self.latency = latency
+
+    def __call__(self, text: str, voice: str, model: str) -> Iterator[bytes]:
+        seed = bytes.fromhex(audio_key(text, voice, model))
+        for _ in range(0, max(len(text), 1), 32):
+            if self.latency:
+                time.sleep(self.latency)
+            yield seed * 8
+
+
+class AudioCache:
+    """Disk cache of synthesized speech, keyed by audio_key.
+
+    Files are named by their key and written through a temporary file, so a
+    reader never sees a partial clip and concurrent misses simply race to
+    publish identical bytes. The directory may be shared by several worker
+    processes; each adopts the clips the others wrote. Once the cache exceeds
+    max_bytes the least recently served clips are deleted.
+    """
+
+    def __init__(self, synthesizer: Synthesizer, directory: Path = TTS_CACHE_DIR,
+                 max_bytes: int = TTS_CACHE_MAX_BYTES):
+        self.synthesizer = synthesizer
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._load()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.mp3"
+
+    def _load(self) -> None:
+        """Rebuild the LRU order from file access times after a restart."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = sorted(self.directory.glob("*.mp3"), key=lambda path: path.stat().st_atime)
+        for path in files:
+            size = path.stat().st_size
+            self._sizes[path.stem] = size
+            self._total += size
+
+    def _touch(self, key: str) -> Optional[Path]:
+        path = self._path(key)
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            size = None
+        with self._lock:
+            if size is None:
+                # Never cached, or evicted by another worker process
+                self._total -= self._sizes.pop(key, 0)
+                return None
+            if key not in self._sizes:
+                # Published by another worker process
+                self._sizes[key] = size
+                self._total += size
+            self._sizes.move_to_end(key)
+            self.hits += 1
+        os.utime(path)
+        return path
+
+    def _add(self, key: str, size: int) -> None:
+        with self._lock:
+            self._total += size - self._sizes.pop(key, 0)
+            self._sizes[key] = size
+            while self._total > self.max_bytes and len(self._sizes) > 1:
+                evicted, evicted_size = self._sizes.popitem(last=False)
+                self._total -= evicted_size
+                self._path(evicted).unlink(missing_ok=True)
+
+    def contains(self, text: str, voice: str, model: str) -> bool:
+        """Whether the clip is on disk, whichever worker process wrote it."""
+        return self._path(audio_key(text, voice, model)).exists()
+
+    def stream(self, text: str, voice: str, model: str) -> Iterator[bytes]:
+        """Speech for text, served from disk on a hit and streamed through on a miss."""
+        key = audio_key(text, voice, model)
+        path = self._touch(key)
+        if path is not None:
+            with open(path, "rb") as audio:
+                while chunk := audio.read(CHUNK_BYTES):
+                    yield chunk
+            return
+
+        with self._lock:
+            self.misses += 1
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            size = 0
+            with os.fdopen(fd, "wb") as temp:
+                for chunk in self.synthesizer(text, voice, model):
+                    temp.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+            if size:
+                os.replace(temp_path, self._path(key))
+                self._add(key, size)
+        finally:
+            # Failed or abandoned syntheses are never cached
+            Path(temp_path).unlink(missing_ok=True)
+
+
+def create_synthesizer() -> Synthesizer:
+    if TTS_BACKEND == "stub":
+        return StubSynthesizer()
+    # elevenlabs is imported on the first synthesis, not at server start
+    return elevenlabs_synthesizer
+
+
+audio_cache = AudioCache(create_synthesizer())
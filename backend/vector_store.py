@@ -0,0 +1,351 @@
+import atexit
+import fcntl
+import hashlib
+import itertools
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain.embeddings.openai import OpenAIEmbeddings
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.vectorstores import Chroma
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+CHROMA_DIR = Path(os.getenv("CHROMA_DIR", "./.chroma"))
+READY_MARKER = "READY"
+STORES_KEPT = 2
+INGEST_BATCH_DOCS = int(os.getenv("INGEST_BATCH_DOCS", "64"))
+# VectorstoreIndexCreator's default splitter
+TEXT_SPLITTER = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+RETRIEVER_CACHE_SIZE = int(os.getenv("RETRIEVER_CACHE_SIZE", "32"))
+RETRIEVER_IDLE_SECONDS = float(os.getenv("RETRIEVER_IDLE_SECONDS", "1800"))
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "default")  # or "stub"
+STUB_EMBED_DIMENSION = int(os.getenv("STUB_EMBED_DIMENSION", "384"))
+STUB_EMBED_LATENCY = float(os.getenv("STUB_EMBED_LATENCY", "0"))
+EMBED_CACHE_PATH = Path(os.getenv("EMBED_CACHE_PATH", "./.embed_cache.sqlite"))
+SQLITE_MAX_PARAMS = 900
+
+_embeddings: Optional[Embeddings] = None
+_embeddings_lock = threading.Lock()
+_build_locks: Dict[Path, threading.Lock] = {}
+_build_locks_guard = threading.Lock()
+_store_locks: Dict[Path, threading.Lock] = {}
+
+
+def store_path(project_id: str, commit: str) -> Path:
+    """Persist directory of a project's vector store at a given commit."""
+    return CHROMA_DIR / project_id / commit
+
+
+class StubEmbeddings(Embeddings):
+    """Offline embeddings: hashed bag of words, so texts sharing words are close.
+
+    Deterministic and free; STUB_EMBED_LATENCY adds a delay per call to model
+    a real embedding round trip.
+    """
+
+    def __init__(self, dimension: int = STUB_EMBED_DIMENSION, latency: float = STUB_EMBED_LATENCY):
+        self.dimension = dimension
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimension
+            vector[bucket] += 1 if digest[4] & 1 else -1
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings shared across projects through an on-disk cache.
+
+    Vectors are stored in SQLite keyed by a hash of the model and the chunk
+    text, so a template, fork or config file that appears in many
+    submissions is only sent to the embedding provider once. The file is
+    shared by every worker process on the host.
+    """
+
+    def __init__(self, embeddings: Embeddings, model: str, path: Path = EMBED_CACHE_PATH):
+        self.embeddings = embeddings
+        self.model = model
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def _key(self, kind: str, text: str) -> str:
+        return hashlib.sha256("\0".join((self.model, kind, text)).encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), SQLITE_MAX_PARAMS):
+                batch = keys[start:start + SQLITE_MAX_PARAMS]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                )
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]) -> None:
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()]
+            )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("document", text) for text in texts]
+        found = self._lookup(list(set(keys)))
+        # Identical chunks within the batch are embedded once too
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            embedded = dict(zip(missing.keys(), vectors))
+            self._store(embedded)
+            found.update(embedded)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Analysis questions repeat for every project
+        key = self._key("query", text)
+        found = self._lookup([key])
+        if key in found:
+            self.hits += 1
+            return found[key]
+        self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self._store({key: vector})
+        return vector
+
+
+def get_embeddings() -> Embeddings:
+    """The process-wide embeddings, behind the cross-project cache."""
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            if EMBED_BACKEND == "stub":
+                stub = StubEmbeddings()
+                _embeddings = CachedEmbeddings(stub, f"stub-{stub.dimension}")
+            else:
+                openai = OpenAIEmbeddings()
+                _embeddings = CachedEmbeddings(openai, f"openai-{openai.model}")
+        return _embeddings
+
+
+def open_vectorstore(project_id: str, commit: str) -> Optional[Chroma]:
+    """Open a previously persisted store, or None if it was never completed."""
+    path = store_path(project_id, commit)
+    if not (path / READY_MARKER).exists():
+        return None
+    return Chroma(persist_directory=str(path), embedding_function=get_embeddings())
+
+
+def store_lock(project_id: str, commit: str) -> threading.Lock:
+    """Lock to hold while querying a store; the Chroma client is not safe to query from several threads at once.
+
+    Shared by every client of the store in this process, so chat and
+    analysis queries of the same commit do not overlap either.
+    """
+    with _build_locks_guard:
+        return _store_locks.setdefault(store_path(project_id, commit), threading.Lock())
+
+
+def close_vectorstore(vectorstore: Chroma) -> None:
+    """Let a store's client be freed.
+
+    chromadb registers every client's persist with atexit, which keeps each
+    store ever opened in memory and writes pruned stores back to disk at
+    shutdown. Stores are persisted when they are built and only read
+    afterwards, so there is nothing left to write.
+    """
+    atexit.unregister(vectorstore._client._db.persist)
+
+
+@contextmanager
+def _build_lock(path: Path) -> Iterator[None]:
+    """Hold the build of a store against other threads and other worker processes."""
+    with _build_locks_guard:
+        lock = _build_locks.setdefault(path, threading.Lock())
+    with lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_name(f"{path.name}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def build_vectorstore(documents: Iterable[Document], project_id: str, commit: str) -> Chroma:
+    """Embed documents into a persisted per-project store.
+
+    Documents are consumed in batches of INGEST_BATCH_DOCS, so a lazily
+    loaded repository is never held in memory all at once. Builds of the same
+    project and commit are serialized across threads and worker processes,
+    so a repository is embedded once per commit even when chat and analysis
+    race for it.
+    """
+    path = store_path(project_id, commit)
+    with _build_lock(path):
+        vectorstore = open_vectorstore(project_id, commit)
+        if vectorstore is not None:
+            return vectorstore
+
+        # Discard what an interrupted build left behind
+        shutil.rmtree(path, ignore_errors=True)
+        path.mkdir(parents=True)
+        vectorstore = Chroma(persist_directory=str(path), embedding_function=get_embeddings())
+        documents = iter(documents)
+        while True:
+            batch = list(itertools.islice(documents, INGEST_BATCH_DOCS))
+            if not batch:
+                break
+            vectorstore.add_documents(TEXT_SPLITTER.split_documents(batch))
+        vectorstore.persist()
+        # Readers only open stores whose build finished
+        (path / READY_MARKER).touch()
+        logger.info(f"Persisted vector store for project {project_id} at {commit}")
+        return vectorstore
+
+
+def stored_sources(vectorstore: Chroma, sources: Iterable[str]) -> List[str]:
+    """The given source paths that have chunks in the store."""
+    return [
+        source for source in sources
+        if vectorstore._collection.get(where={"source": source})["ids"]
+    ]
+
+
+def derive_vectorstore(project_id: str, base_commit: str, commit: str,
+                       documents: List[Document], stale_sources: Iterable[str]) -> Chroma:
+    """Create the store for commit from base_commit's, re-embedding only changed files.
+
+    Chunks of stale_sources are dropped from a copy of the base store and
+    the new versions of the changed documents are embedded into it.
+    """
+    path = store_path(project_id, commit)
+    with _build_lock(path):
+        vectorstore = open_vectorstore(project_id, commit)
+        if vectorstore is not None:
+            return vectorstore
+
+        shutil.rmtree(path, ignore_errors=True)
+        shutil.copytree(store_path(project_id, base_commit), path,
+                        ignore=shutil.ignore_patterns(READY_MARKER))
+        vectorstore = Chroma(persist_directory=str(path), embedding_function=get_embeddings())
+        for source in stale_sources:
+            vectorstore._collection.delete(where={"source": source})
+        chunks = TEXT_SPLITTER.split_documents(documents)
+        if chunks:
+            vectorstore.add_documents(chunks)
+        vectorstore.persist()
+        (path / READY_MARKER).touch()
+        logger.info(f"Derived vector store for project {project_id} at {commit} "
+                    f"from {base_commit} ({len(chunks)} new chunks)")
+        return vectorstore
+
+
+def prune_stores(project_id: str, keep: int = STORES_KEPT) -> None:
+    """Delete all but the most recently completed stores of a project."""
+    stores = sorted(
+        (p.parent for p in (CHROMA_DIR / project_id).glob(f"*/{READY_MARKER}")),
+        key=lambda p: (p / READY_MARKER).stat().st_mtime,
+        reverse=True
+    )
+    for path in stores[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class RetrieverCache:
+    """Thread-safe LRU of open retrievers with size and idle-time eviction.
+
+    on_evict is called with each value dropped from the cache, outside the lock.
+    """
+
+    def __init__(self, max_size: int = RETRIEVER_CACHE_SIZE, idle_seconds: float = RETRIEVER_IDLE_SECONDS,
+                 on_evict: Optional[Callable[[Any], None]] = None):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float) -> List[Any]:
+        evicted = [
+            self._entries.pop(key)[0]
+            for key in [k for k, (_, used) in self._entries.items() if now - used > self.idle_seconds]
+        ]
+        while len(self._entries) > self.max_size:
+            evicted.append(self._entries.popitem(last=False)[1][0])
+        return evicted
+
+    def _release(self, values: List[Any]) -> None:
+        if self.on_evict is None:
+            return
+        for value in values:
+            try:
+                self.on_evict(value)
+            except Exception as e:
+                logger.error(f"Error releasing evicted retriever: {e}")
+
+    def get(self, key: Tuple[str, str], factory: Callable[[], Any]) -> Any:
+        """Return the cached value for key, creating it with factory on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            evicted = self._evict(now)
+            value = None
+            if key in self._entries:
+                value, _ = self._entries.pop(key)
+                self._entries[key] = (value, now)
+        self._release(evicted)
+        if value is not None:
+            return value
+
+        # Build outside the lock so one slow project does not block the others
+        value = factory()
+        with self._lock:
+            if key in self._entries:
+                # Built concurrently by another thread; keep one
+                evicted = [value]
+                value, _ = self._entries[key]
+            else:
+                evicted = []
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            evicted += self._evict(time.monotonic())
+        self._release(evicted)
+        return value
+
+    def invalidate(self, project_id: str) -> None:
+        with self._lock:
+            evicted = [self._entries.pop(key)[0] for key in [k for k in self._entries if k[0] == project_id]]
+        self._release(evicted)